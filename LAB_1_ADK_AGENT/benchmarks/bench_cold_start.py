@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Cold-start benchmark for the get_employee_leave_balance tool.
+
+Every run starts a fresh Python interpreter (like a new orchestrate tool
+sandbox), imports the tool module from its file and calls it once, then
+reports module import time, first-call time and total process wall time.
+Pass --baseline with a git revision (or a file path) to measure an older
+version of the tool side by side, e.g. the pandas-based loader:
+
+    python benchmarks/bench_cold_start.py --runs 20
+    python benchmarks/bench_cold_start.py --baseline HEAD~1 --json cold_start.json
+
+Requires ibm-watsonx-orchestrate to be installed (the tool imports its @tool
+decorator), plus pandas when benchmarking a pandas-based baseline.
+"""
+import argparse
+import json
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+HERE = Path(__file__).resolve().parent
+TOOL_DIR = HERE.parent / "tools" / "get_employee_leave_balance"
+TOOL_FILE = TOOL_DIR / "get_employee_leave_balance.py"
+CSV_FILE = TOOL_DIR / "employee_leave_balance.csv"
+REPO_ROOT = HERE.parent.parent
+
+# Runs inside the fresh interpreter; prints one JSON line with the timings
+PROBE = r"""
+import importlib.util, json, sys, time
+t0 = time.perf_counter()
+spec = importlib.util.spec_from_file_location("leave_tool", sys.argv[1])
+module = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(module)
+t1 = time.perf_counter()
+result = module.get_employee_leave_balance(sys.argv[2])
+t2 = time.perf_counter()
+print(json.dumps({"import_ms": (t1 - t0) * 1000, "first_call_ms": (t2 - t1) * 1000,
+                  "found": bool(result) and "value" not in result}))
+"""
+
+
+def baseline_file(ref: str, workdir: Path) -> Path:
+    """Materialise the baseline tool next to a copy of the CSV (the tool reads it via __file__)."""
+    path = Path(ref)
+    if path.is_file():
+        source = path.read_text(encoding="utf-8")
+    else:
+        rel = TOOL_FILE.relative_to(REPO_ROOT).as_posix()
+        source = subprocess.run(["git", "show", f"{ref}:{rel}"], cwd=REPO_ROOT, check=True,
+                                capture_output=True, text=True).stdout
+    target = workdir / TOOL_FILE.name
+    target.write_text(source, encoding="utf-8")
+    shutil.copy(CSV_FILE, workdir / CSV_FILE.name)
+    return target
+
+
+def run_once(tool_file: Path, employee_id: str) -> dict:
+    started = time.perf_counter()
+    proc = subprocess.run([sys.executable, "-c", PROBE, str(tool_file), employee_id],
+                          capture_output=True, text=True)
+    wall_ms = (time.perf_counter() - started) * 1000
+    if proc.returncode != 0:
+        raise SystemExit(f"{tool_file} failed:\n{proc.stderr.strip()}")
+    timings = json.loads(proc.stdout.strip().splitlines()[-1])
+    timings["wall_ms"] = wall_ms
+    return timings
+
+
+def measure(label: str, tool_file: Path, args) -> dict:
+    for _ in range(args.warmup):
+        run_once(tool_file, args.employee_id)  # warm the OS page cache, not the interpreter
+    runs = [run_once(tool_file, args.employee_id) for _ in range(args.runs)]
+    if not all(r["found"] for r in runs):
+        print(f"warning: {label} did not return a record for {args.employee_id}", file=sys.stderr)
+    summary = {"label": label, "file": str(tool_file), "runs": args.runs}
+    for key in ("import_ms", "first_call_ms", "wall_ms"):
+        values = [r[key] for r in runs]
+        summary[key] = {"median": statistics.median(values), "min": min(values), "max": max(values)}
+    return summary
+
+
+def print_table(results):
+    print(f"{'version':<12} {'import ms':>20} {'first call ms':>20} {'process ms':>20}")
+    print("-" * 75)
+    for r in results:
+        cells = [f"{r[k]['median']:8.1f} ({r[k]['min']:.1f}-{r[k]['max']:.1f})"
+                 for k in ("import_ms", "first_call_ms", "wall_ms")]
+        print(f"{r['label']:<12} {cells[0]:>20} {cells[1]:>20} {cells[2]:>20}")
+    print("median (min-max) over fresh interpreters")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Cold-start benchmark for the leave-balance tool.")
+    parser.add_argument("--runs", type=int, default=20, help="fresh interpreters per version")
+    parser.add_argument("--warmup", type=int, default=2, help="runs before measuring (not reported)")
+    parser.add_argument("--employee-id", default="EMP001")
+    parser.add_argument("--baseline", help="git revision or file path of an older tool version to compare")
+    parser.add_argument("--json", type=Path, help="also write results to this file")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.baseline:
+            results.append(measure("baseline", baseline_file(args.baseline, Path(tmp)), args))
+        results.append(measure("current", TOOL_FILE, args))
+    print_table(results)
+    if args.json:
+        args.json.write_text(json.dumps(results, indent=2), encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
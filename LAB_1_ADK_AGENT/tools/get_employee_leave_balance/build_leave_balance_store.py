@@ -0,0 +1,31 @@
+"""
+Convert employee_leave_balance.csv into the compact store (employee_leave_balance.lvb)
+that get_employee_leave_balance reads via mmap and binary search.
+
+Rebuild after every CSV export; while the CSV is newer than the store the tool
+falls back to reading the CSV.
+
+    python build_leave_balance_store.py
+    python build_leave_balance_store.py --csv /data/hr_extract.csv --out employee_leave_balance.lvb
+"""
+import argparse
+import os
+import time
+
+from get_employee_leave_balance import CSV_PATH, STORE_PATH, build_store
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the leave-balance store from a CSV export.")
+    parser.add_argument("--csv", default=CSV_PATH, help="source CSV (default: %(default)s)")
+    parser.add_argument("--out", default=STORE_PATH, help="store file to write (default: %(default)s)")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    rows = build_store(args.csv, args.out)
+    print(f"Wrote {rows:,} rows to {args.out} ({os.path.getsize(args.out) / 1e6:.1f} MB) "
+          f"in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
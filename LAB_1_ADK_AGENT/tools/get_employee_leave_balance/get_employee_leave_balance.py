@@ -1,11 +1,306 @@
 from ibm_watsonx_orchestrate.agent_builder.tools import tool
-import pandas as pd
+from typing import Optional
+import csv
+import io
+import json
+import math
+import mmap
+import operator
 import os
+import struct
+import threading
+
+CSV_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'employee_leave_balance.csv')
+# Sorted, memory-mapped copy of the CSV built by build_leave_balance_store.py; used when present
+STORE_PATH = os.path.splitext(CSV_PATH)[0] + '.lvb'
+
+# Lowercased employee_id -> first row of the employee's latest leave_year, and
+# (employee_id, leave_year) -> first row of that year; rebuilt when the CSV changes
+_index = {}
+_index_version = None
+_index_lock = threading.Lock()
+
+_store = None
+_store_version = None
+_store_lock = threading.Lock()
+
+# Column name -> array over all (employee_id, leave_year) rows, for query_leave_balances,
+# plus a boolean array marking each employee's latest leave_year row
+_columns = None
+_columns_version = None
+_columns_lock = threading.Lock()
+
+# Columns that hold whole numbers; everything else (employee_id, last_updated) stays a string
+INT_COLUMNS = ('leave_year',)
+INT_SUFFIXES = ('_total', '_used', '_available')
+
+def _to_number(value: str):
+    """Parse a numeric cell as int (or float for fractional days); empty cells become None."""
+    value = (value or '').strip()
+    if not value:
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        return float(value)
+
+def _numeric_columns(fieldnames) -> list:
+    return [name for name in fieldnames or () if name in INT_COLUMNS or name.endswith(INT_SUFFIXES)]
+
+def _read_records(path: str):
+    """Yield CSV rows as dicts with numeric leave columns converted."""
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        reader = csv.DictReader(f)
+        numeric = _numeric_columns(reader.fieldnames)
+        for row in reader:
+            for name in numeric:
+                row[name] = _to_number(row[name])
+            yield row
+
+def _load_index() -> dict:
+    """
+    Return the employee index, re-reading the CSV only if its mtime/size changed
+    since the last load. Raises FileNotFoundError / KeyError on a missing file or column.
+    """
+    global _index, _index_version
+    stat = os.stat(CSV_PATH)
+    version = (stat.st_mtime_ns, stat.st_size)
+    if version == _index_version:
+        return _index
+    with _index_lock:
+        if version != _index_version:
+            index = {}
+            for record in _read_records(CSV_PATH):
+                employee_id = record['employee_id']
+                if employee_id:
+                    key = employee_id.lower()
+                    index.setdefault((key, record.get('leave_year')), record)
+                    latest = index.get(key)
+                    if latest is None or _year_rank(record) > _year_rank(latest):
+                        index[key] = record
+            _index, _index_version = index, version
+    return _index
+
+# ---------- Compact on-disk store ----------
+# Layout: header | JSON column list | key table | rows
+#   key table: one fixed-width entry per row, sorted by (lowercased employee_id, leave_year, ordinal)
+#   rows: the CSV lines, written in key order so one employee's years share a page
+STORE_MAGIC = b'LVB1'
+STORE_HEADER = struct.Struct('<4sIQI')   # magic, key width, row count, column list length
+NO_YEAR = -2 ** 31                       # sorts before every real leave_year
+
+def _year_rank(record: dict) -> int:
+    """Sort key for picking an employee's latest leave year; rows without a year rank lowest."""
+    year = record.get('leave_year')
+    return NO_YEAR if year is None else year
+
+def _store_entry(key_width: int) -> struct.Struct:
+    # key (NUL-padded UTF-8), leave_year, original row ordinal, row offset;
+    # a row ends where the next entry's row starts (rows are written in key order)
+    return struct.Struct(f'<{key_width}siIQ')
+
+def build_store(csv_path: str = CSV_PATH, store_path: str = STORE_PATH) -> int:
+    """
+    Convert the leave-balance CSV into the sorted store read by LeaveBalanceStore.
+    Writes to a temporary file and renames it, so running tools pick up the new file atomically.
+    Returns the number of rows written.
+    """
+    with open(csv_path, newline='', encoding='utf-8-sig') as f:
+        reader = csv.reader(f)
+        columns = next(reader)
+        id_at, year_at = columns.index('employee_id'), columns.index('leave_year')
+        rows = []
+        for ordinal, row in enumerate(reader):
+            if len(row) <= id_at or not row[id_at]:
+                continue
+            year = _to_number(row[year_at]) if len(row) > year_at else None
+            rows.append((row[id_at].lower().encode('utf-8'), NO_YEAR if year is None else int(year), ordinal, row))
+    rows.sort(key=lambda r: r[:3])
+
+    key_width = max((len(r[0]) for r in rows), default=1)
+    entry = _store_entry(key_width)
+    column_bytes = json.dumps(columns).encode('utf-8')
+    rows_at = STORE_HEADER.size + len(column_bytes) + entry.size * len(rows)
+
+    tmp_path = store_path + '.tmp'
+    with open(tmp_path, 'wb') as out:
+        out.write(STORE_HEADER.pack(STORE_MAGIC, key_width, len(rows), len(column_bytes)))
+        out.write(column_bytes)
+        encoded, offset = [], rows_at
+        for key, year, ordinal, row in rows:
+            line = io.StringIO()
+            csv.writer(line).writerow(row)
+            data = line.getvalue().encode('utf-8')
+            out.write(entry.pack(key, year, ordinal, offset))
+            encoded.append(data)
+            offset += len(data)
+        out.writelines(encoded)
+    os.replace(tmp_path, store_path)
+    return len(rows)
+
+class LeaveBalanceStore:
+    """Read-only, memory-mapped view of a store file; lookups binary-search the key table."""
+
+    def __init__(self, path: str):
+        with open(path, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self._key_width, self.count, columns_len = STORE_HEADER.unpack_from(self._mm, 0)
+        if magic != STORE_MAGIC:
+            raise ValueError(f"{path} is not a leave balance store")
+        self.columns = json.loads(self._mm[STORE_HEADER.size:STORE_HEADER.size + columns_len])
+        self._numeric = set(_numeric_columns(self.columns))
+        self._entry = _store_entry(self._key_width)
+        self._keys_at = STORE_HEADER.size + columns_len
+
+    def _entry_at(self, i: int) -> tuple:
+        return self._entry.unpack_from(self._mm, self._keys_at + i * self._entry.size)
+
+    def _lower_bound(self, key: bytes, year: int) -> int:
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            mid_key, mid_year = self._entry_at(mid)[:2]
+            if (mid_key, mid_year) < (key, year):
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def _record(self, i: int) -> dict:
+        offset = self._entry_at(i)[3]
+        end = self._entry_at(i + 1)[3] if i + 1 < self.count else len(self._mm)
+        row = next(csv.reader([self._mm[offset:end].decode('utf-8')]))
+        record = dict(zip(self.columns, row + [None] * (len(self.columns) - len(row))))
+        for name in self._numeric:
+            record[name] = _to_number(record[name])
+        return record
+
+    def lookup(self, employee_id: str, leave_year: Optional[int] = None) -> Optional[dict]:
+        """First CSV row for the employee and leave_year (default: their latest leave year), or None."""
+        key = employee_id.lower().encode('utf-8')
+        if len(key) > self._key_width:
+            return None
+        key = key.ljust(self._key_width, b'\0')
+        i = self._lower_bound(key, NO_YEAR if leave_year is None else leave_year)
+        first = None
+        # Entries for one key are contiguous and sorted by (year, ordinal): the first entry of a
+        # year is its first CSV row, and without a year the last year block is the latest one
+        while i < self.count:
+            entry_key, year, _, _ = self._entry_at(i)
+            if entry_key != key or (leave_year is not None and year != leave_year):
+                break
+            if first is None or year != first[0]:
+                first = (year, i)
+            if leave_year is not None:
+                break
+            i += 1
+        return None if first is None else self._record(first[1])
+
+    def records(self):
+        """Yield the first row of every (employee_id, leave_year) in key order."""
+        previous = None
+        for i in range(self.count):
+            entry = self._entry_at(i)
+            # Duplicates are adjacent and ordered by ordinal, so the first one is the first CSV row
+            if entry[:2] != previous:
+                previous = entry[:2]
+                yield self._record(i)
+
+def _load_store() -> Optional[LeaveBalanceStore]:
+    """
+    Return the mapped store, reopening it when the file is replaced. Returns None when there is
+    no store, or when the CSV was edited after the store was built (the CSV is then authoritative).
+    """
+    global _store, _store_version
+    try:
+        stat = os.stat(STORE_PATH)
+    except FileNotFoundError:
+        return None
+    try:
+        if os.stat(CSV_PATH).st_mtime_ns > stat.st_mtime_ns:
+            return None
+    except FileNotFoundError:
+        pass
+    version = (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+    if version != _store_version:
+        with _store_lock:
+            if version != _store_version:
+                _store, _store_version = LeaveBalanceStore(STORE_PATH), version
+    return _store
+
+def _finder():
+    """Return a lookup function backed by the store if present, otherwise by the in-memory CSV index."""
+    store = _load_store()
+    if store is not None:
+        return store.lookup
+    index = _load_index()
+
+    def find(employee_id: str, leave_year: Optional[int] = None) -> Optional[dict]:
+        key = employee_id.lower()
+        record = index.get(key if leave_year is None else (key, leave_year))
+        # Copy so callers cannot modify the cached row
+        return None if record is None else dict(record)
+    return find
+
+def _load_columns() -> tuple:
+    """
+    Return (columns, latest): the dataset as column arrays (numeric leave columns as float64 with
+    NaN for empty cells), keeping the first row per (employee_id, leave_year), and a boolean array
+    marking each employee's latest leave_year row. Rebuilt when the source changes.
+    """
+    global _columns, _columns_version
+    store = _load_store()
+    if store is not None:
+        version, records = ('store', _store_version), store.records
+    else:
+        stat = os.stat(CSV_PATH)
+        version, records = ('csv', stat.st_mtime_ns, stat.st_size), lambda: _read_records(CSV_PATH)
+    if version == _columns_version:
+        return _columns
+    with _columns_lock:
+        if version != _columns_version:
+            # Imported here so the lookup tools don't pay for NumPy at cold start
+            import numpy as np
+            values, seen, newest = {}, set(), {}
+            for record in records():
+                # Same rows as the lookups: the store and the CSV index both skip empty IDs
+                if not record['employee_id']:
+                    continue
+                key = (record['employee_id'].lower(), record.get('leave_year'))
+                if key in seen:
+                    continue
+                year = _year_rank(record)
+                if key[0] not in newest or year > newest[key[0]][0]:
+                    newest[key[0]] = (year, len(seen))
+                seen.add(key)
+                for name, value in record.items():
+                    values.setdefault(name, []).append(value)
+            columns = {}
+            for name, column in values.items():
+                if name in INT_COLUMNS or name.endswith(INT_SUFFIXES):
+                    columns[name] = np.array([np.nan if v is None else v for v in column], dtype=np.float64)
+                else:
+                    columns[name] = np.array(column, dtype=object)
+            latest = np.zeros(len(seen), dtype=bool)
+            latest[[row for _, row in newest.values()]] = True
+            _columns, _columns_version = (columns, latest), version
+    return _columns
+
+def _plain(value):
+    """Convert a NumPy scalar back to the int/float/str/None shape the other tools return."""
+    if hasattr(value, 'item'):
+        value = value.item()
+    if isinstance(value, float):
+        if math.isnan(value):
+            return None
+        if value.is_integer():
+            return int(value)
+    return value
 
 @tool
-def get_employee_leave_balance(employee_id: str) -> dict:
+def get_employee_leave_balance(employee_id: str, leave_year: Optional[int] = None) -> dict:
     """
-    Retrieves leave balance information for a specified employee (case-insensitive) from a CSV file (mocked as a DataFrame).
+    Retrieves leave balance information for a specified employee (case-insensitive) from the HR leave balance records.
 
     Summary of Leave Balance Data:
         - Annual leave (total, used, available)
@@ -15,29 +310,153 @@ def get_employee_leave_balance(employee_id: str) -> dict:
 
     Args:
         employee_id (str): Employee ID to look up (case-insensitive, e.g., 'EMP001').
+        leave_year (int, optional): Leave year to return (e.g., 2025). Defaults to the employee's latest leave year.
 
     Returns:
         dict: Dictionary with leave balance details for an employee, or empty dict if not found.
     """
     try:
-        # Read the CSV file
-        base_path = os.path.dirname(os.path.abspath(__file__))
-        file_path = os.path.join(base_path, 'employee_leave_balance.csv')
-        df = pd.read_csv(file_path)
-
-        # Case-insensitive match for employee_id
-        mask = df['employee_id'].str.lower() == employee_id.lower()
-        filtered_df = df[mask]
+        # Case-insensitive lookup (first row of the year wins)
+        record = _finder()(employee_id, leave_year)
 
         # Check if any rows match
-        if filtered_df.empty:
+        if record is None:
             print(f"No employee with ID {employee_id} found")
             return {}
 
-        # Convert the first matching row to dictionary
-        result_dict = filtered_df.iloc[0].to_dict()
+        return record
+
+    except FileNotFoundError:
+        print("CSV file not found")
+        return {
+          "value": "csv file not found"
+        }
+    except KeyError as e:
+        print(f"Column not found: {e}")
+        return {
+          "value": "column not found"
+        }
+    except Exception as e:
+        print(f"An error occurred: {e}")
+        return {
+          "value": "unknown error"
+        }
+
+@tool
+def get_employee_leave_balances(employee_ids: list[str], leave_year: Optional[int] = None) -> dict:
+    """
+    Retrieves leave balance information for several employees (case-insensitive) in one call,
+    e.g. for a manager asking about their whole team.
+
+    Args:
+        employee_ids (list[str]): Employee IDs to look up (case-insensitive, e.g., ['EMP001', 'EMP002']).
+        leave_year (int, optional): Leave year to return (e.g., 2025). Defaults to each employee's latest leave year.
+
+    Returns:
+        dict: {"records": [leave balance dict per employee found, in request order],
+               "not_found": [IDs with no record (for that leave year)]}
+    """
+    try:
+        find = _finder()
+        records, not_found, seen = [], [], set()
+        for employee_id in employee_ids:
+            key = employee_id.lower()
+            # Return each employee once even if the ID is repeated with different casing
+            if key in seen:
+                continue
+            seen.add(key)
+            record = find(employee_id, leave_year)
+            if record is None:
+                not_found.append(employee_id)
+            else:
+                records.append(record)
+
+        if not_found:
+            print(f"No employee with ID {', '.join(not_found)} found")
+        return {"records": records, "not_found": not_found}
+
+    except FileNotFoundError:
+        print("CSV file not found")
+        return {
+          "value": "csv file not found"
+        }
+    except KeyError as e:
+        print(f"Column not found: {e}")
+        return {
+          "value": "column not found"
+        }
+    except Exception as e:
+        print(f"An error occurred: {e}")
+        return {
+          "value": "unknown error"
+        }
+
+COMPARISONS = {
+    '>': operator.gt, '>=': operator.ge, '<': operator.lt,
+    '<=': operator.le, '==': operator.eq, '!=': operator.ne,
+}
+
+@tool
+def query_leave_balances(column: str, op: str, value: float, leave_year: Optional[int] = None,
+                         order: str = "desc", top_n: int = 10) -> dict:
+    """
+    Finds employees whose leave balance column matches a condition, e.g. who has more than 15
+    annual leave days left (annual_leave_available > 15) or who has used all sick leave
+    (sick_leave_available <= 0). Returns how many employees match, summary statistics and the top-N.
+
+    Args:
+        column (str): Numeric column to test, e.g. 'annual_leave_available', 'sick_leave_used', 'personal_leave_total'.
+        op (str): Comparison operator: '>', '>=', '<', '<=', '==' or '!='.
+        value (float): Number of days to compare against.
+        leave_year (int, optional): Only consider this leave year (e.g., 2025). Defaults to each
+            employee's latest leave year, so every employee is counted once.
+        order (str): Sort matches by the column value, 'desc' (highest first) or 'asc'. Defaults to 'desc'.
+        top_n (int): Maximum number of matching records to return (0 for counts only). Defaults to 10.
+
+    Returns:
+        dict: {"count": matching rows, "total": rows considered, "sum"/"mean"/"min"/"max": of the column
+               over the matches, "records": up to top_n matching leave balance dicts}
+    """
+    try:
+        if op not in COMPARISONS:
+            return {
+              "value": f"unsupported operator, use one of {', '.join(COMPARISONS)}"
+            }
+        if order not in ('desc', 'asc'):
+            return {
+              "value": "unsupported order, use 'desc' or 'asc'"
+            }
+        columns, latest = _load_columns()
+        if column not in columns or columns[column].dtype == object:
+            raise KeyError(column)
+
+        import numpy as np
+        data = columns[column]
+        # Empty cells are NaN, which would otherwise satisfy '!='
+        considered = latest if leave_year is None else columns['leave_year'] == leave_year
+        mask = COMPARISONS[op](data, value) & ~np.isnan(data) & considered
+        total = int(np.count_nonzero(considered))
+        matches = np.flatnonzero(mask)
+        matched = data[matches]
+
+        result = {"count": int(len(matches)), "total": total}
+        if len(matches):
+            result.update({
+                "sum": _plain(np.nansum(matched)), "mean": round(float(np.nanmean(matched)), 2),
+                "min": _plain(np.nanmin(matched)), "max": _plain(np.nanmax(matched)),
+            })
 
-        return result_dict
+        # Top-N by the column value: partial selection, then sort only the selected rows
+        keys = -matched if order == "desc" else matched
+        limit = max(0, min(top_n, len(matches)))
+        if 0 < limit < len(matches):
+            chosen = np.argpartition(keys, limit - 1)[:limit]
+            chosen = chosen[np.argsort(keys[chosen], kind='stable')]
+        else:
+            chosen = np.argsort(keys, kind='stable')[:limit]
+        rows = matches[chosen]
+        result["records"] = [{name: _plain(array[i]) for name, array in columns.items()} for i in rows]
+        return result
 
     except FileNotFoundError:
         print("CSV file not found")
@@ -1,17 +1,40 @@
 import os
 import json
+import queue
 import re
 import sqlite3
-from typing import Optional, Dict, Any, List
+import asyncio
+import contextvars
+import threading
+import time
+import unicodedata
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager, closing, contextmanager
+from pathlib import Path
+from typing import Optional, Dict, Any, List, Literal, Tuple
 
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import Response, StreamingResponse
 from pydantic import BaseModel, Field
 from dotenv import load_dotenv
 
 from ibm_watsonx_ai import Credentials
 from ibm_watsonx_ai.foundation_models import ModelInference
 
+# Optional binary result formats (format="msgpack" / format="arrow")
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+try:
+    import pyarrow
+    import pyarrow.ipc
+except ImportError:
+    pyarrow = None
+
 # =========================
 # Env & Model Initialization
 # =========================
@@ -37,23 +60,596 @@ model = ModelInference(
     project_id=WATSONX_PROJECT_ID,
 )
 
+# Model calls go through the SDK's async client, so in-flight requests are not
+# bound to Starlette's threadpool; this only caps how many we send at once.
+MODEL_MAX_CONCURRENCY = int(os.getenv("MODEL_MAX_CONCURRENCY", "256"))
+model_slots = asyncio.Semaphore(MODEL_MAX_CONCURRENCY)
+
+# =========================
+# Metrics
+# =========================
+# Per-stage latency histograms and counters, exported in Prometheus text format
+# on /metrics. Stage timings of the current request are also returned in a
+# Server-Timing header (see ServerTimingMiddleware).
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+ROW_COUNT_BUCKETS = (0, 1, 10, 100, 1000, 10000, 100000)
+
+def _label_str(labels: Tuple[Tuple[str, str], ...]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in labels) + "}"
+
+class Counter:
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help_text = help_text
+        self._values: Dict[Tuple[Tuple[str, str], ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_label_str(key)} {value:g}")
+        return lines
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, buckets: Tuple[float, ...]):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        # labels -> [per-bucket counts..., +Inf count, sum]
+        self._series: Dict[Tuple[Tuple[str, str], ...], List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            else:
+                series[len(self.buckets)] += 1
+            series[-1] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float("inf"),), series):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                    lines.append(f"{self.name}_bucket{_label_str(key + (('le', le),))} {cumulative:g}")
+                lines.append(f"{self.name}_sum{_label_str(key)} {series[-1]:.6f}")
+                lines.append(f"{self.name}_count{_label_str(key)} {cumulative:g}")
+        return lines
+
+stage_seconds = Histogram(
+    "text2sql_stage_seconds", "Latency of one pipeline stage.", LATENCY_BUCKETS)
+result_rows = Histogram(
+    "text2sql_result_rows", "Rows returned per executed query.", ROW_COUNT_BUCKETS)
+model_tokens_total = Counter(
+    "text2sql_model_tokens_total", "Tokens reported by the model, by call and kind.")
+errors_total = Counter(
+    "text2sql_errors_total", "Failed requests by error class.")
+
+# Stage durations (ms) of the request being served; set per request by ServerTimingMiddleware
+request_timings: contextvars.ContextVar[Optional[Dict[str, float]]] = contextvars.ContextVar(
+    "request_timings", default=None)
+
+@contextmanager
+def stage(name: str):
+    """
+    Time a pipeline stage into stage_seconds and the current request's Server-Timing.
+    Use from the event loop side: executor threads do not inherit the request context.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        stage_seconds.observe(elapsed, stage=name)
+        timings = request_timings.get()
+        if timings is not None:
+            timings[name] = timings.get(name, 0.0) + elapsed * 1000
+
+def record_model_usage(call: str, model_output: Dict[str, Any]) -> None:
+    usage = model_output.get("usage") or {}
+    for kind in ("prompt_tokens", "completion_tokens"):
+        if usage.get(kind):
+            model_tokens_total.inc(usage[kind], call=call, kind=kind.split("_")[0])
+
+def error_class(status_code: int, detail: Any) -> str:
+    detail = str(detail)
+    if detail.startswith("sql_budget_exceeded"):
+        return "budget_exceeded"
+    if status_code == 503:
+        return "db_busy"
+    if detail.startswith("SQL parsing error"):
+        return "sql_parse"
+    if detail.startswith("SQL execution error"):
+        return "sql_execution"
+    if detail.startswith(("Only SELECT", "Multiple statements")):
+        return "sql_rejected"
+    if status_code >= 500:
+        return "internal"
+    return "bad_request"
+
 # =========================
 # SQLite (school.db)
 # =========================
 DB_PATH = os.getenv("FURNITURE_DB_PATH", "furniture.db")
 
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "8"))
+DB_POOL_TIMEOUT_SECONDS = float(os.getenv("DB_POOL_TIMEOUT_SECONDS", "30"))
+# Set to 1 when the database file never changes while the app runs (e.g. baked into the image)
+DB_IMMUTABLE = os.getenv("FURNITURE_DB_IMMUTABLE", "0") == "1"
+DB_CACHE_SIZE_KB = int(os.getenv("DB_CACHE_SIZE_KB", "16384"))
+DB_MMAP_SIZE = int(os.getenv("DB_MMAP_SIZE", str(256 * 1024 * 1024)))
+# Prepared statements kept per connection, keyed on SQL text (see parameterize_sql)
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "256"))
+
 def _connect_db() -> sqlite3.Connection:
-    # Thread-safe for FastAPI dev; set row_factory for dict-like rows
-    conn = sqlite3.connect(DB_PATH, check_same_thread=False)
+    # Read-only URI connection; a connection is only ever used by one thread at a time
+    uri = Path(DB_PATH).resolve().as_uri() + ("?immutable=1" if DB_IMMUTABLE else "?mode=ro")
+    conn = sqlite3.connect(uri, uri=True, check_same_thread=False, cached_statements=DB_STATEMENT_CACHE_SIZE)
     conn.row_factory = sqlite3.Row
+    conn.execute(f"PRAGMA cache_size = -{DB_CACHE_SIZE_KB};")
+    conn.execute(f"PRAGMA mmap_size = {DB_MMAP_SIZE};")
+    conn.execute("PRAGMA temp_store = MEMORY;")
+    conn.execute("PRAGMA query_only = 1;")
     return conn
 
-db_conn = _connect_db()
+class SQLiteReadPool:
+    """
+    Fixed-size pool of read-only connections, opened lazily.
+    Callers check a connection out for the duration of one query so queries
+    on different connections run in parallel. Async callers reserve() a
+    connection on the event loop before handing work to db_executor, so its
+    threads never block waiting for a connection a stream is holding.
+    """
+
+    def __init__(self, size: int, timeout: float):
+        self.size = size
+        self.timeout = timeout
+        self._idle: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._created = 0
+        self._probe: Optional[sqlite3.Connection] = None
+        self._slots = asyncio.Semaphore(size)
+        self.checkouts = 0
+        self.waits = 0
+        self.timeouts = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+
+    def _acquire(self) -> sqlite3.Connection:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._created < self.size:
+                self._created += 1
+                try:
+                    return _connect_db()
+                except Exception:
+                    self._created -= 1
+                    raise
+        started = time.perf_counter()
+        try:
+            conn = self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            with self._lock:
+                self.timeouts += 1
+            raise HTTPException(status_code=503, detail="Database busy: no connection available.")
+        waited = time.perf_counter() - started
+        with self._lock:
+            self.waits += 1
+            self.wait_seconds_total += waited
+            self.wait_seconds_max = max(self.wait_seconds_max, waited)
+        return conn
+
+    async def reserve(self) -> None:
+        """
+        Wait on the event loop until a connection is free and claim it for one
+        checkout made on db_executor; pair with release() once that work is done.
+        """
+        if not self._slots.locked():
+            await self._slots.acquire()
+            return
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self.timeout)
+        except asyncio.TimeoutError:
+            with self._lock:
+                self.timeouts += 1
+            raise HTTPException(status_code=503, detail="Database busy: no connection available.")
+        waited = time.perf_counter() - started
+        with self._lock:
+            self.waits += 1
+            self.wait_seconds_total += waited
+            self.wait_seconds_max = max(self.wait_seconds_max, waited)
+
+    def release(self) -> None:
+        self._slots.release()
+
+    @contextmanager
+    def connection(self):
+        conn = self._acquire()
+        with self._lock:
+            self.checkouts += 1
+        try:
+            yield conn
+        finally:
+            self._idle.put(conn)
+
+    def data_version(self) -> Optional[int]:
+        """
+        PRAGMA data_version from a dedicated connection outside the pool;
+        it changes whenever any other connection commits.
+        """
+        with self._lock:
+            try:
+                if self._probe is None:
+                    self._probe = _connect_db()
+                return self._probe.execute("PRAGMA data_version;").fetchone()[0]
+            except sqlite3.Error:
+                return None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "size": self.size,
+                "open": self._created,
+                "idle": self._idle.qsize(),
+                "checkouts": self.checkouts,
+                "waits": self.waits,
+                "timeouts": self.timeouts,
+                "wait_seconds_total": round(self.wait_seconds_total, 6),
+                "wait_seconds_max": round(self.wait_seconds_max, 6),
+            }
+
+db_pool = SQLiteReadPool(DB_POOL_SIZE, DB_POOL_TIMEOUT_SECONDS)
 
-def run_select(sql: str) -> Dict[str, Any]:
+# SQLite work runs on its own bounded pool instead of the shared default executor.
+# Work that checks out a connection goes through run_with_connection / aiter_select,
+# which wait for it on the event loop, so a thread is always free to advance the
+# streams holding connections.
+DB_EXECUTOR_WORKERS = int(os.getenv("DB_EXECUTOR_WORKERS", str(DB_POOL_SIZE)))
+db_executor = ThreadPoolExecutor(max_workers=DB_EXECUTOR_WORKERS, thread_name_prefix="sqlite")
+
+async def run_in_db_executor(func, *args):
+    return await asyncio.get_running_loop().run_in_executor(db_executor, func, *args)
+
+def _release_when_done(future, loop: asyncio.AbstractEventLoop) -> None:
+    # The reservation ends when the thread is done with the connection, not when the caller stops waiting
+    future.add_done_callback(lambda _: loop.call_soon_threadsafe(db_pool.release))
+
+async def run_with_connection(func, *args):
+    """run_in_db_executor for work that checks a connection out of db_pool."""
+    await db_pool.reserve()
+    try:
+        future = db_executor.submit(func, *args)
+    except BaseException:
+        db_pool.release()
+        raise
+    _release_when_done(future, asyncio.get_running_loop())
+    return await asyncio.wrap_future(future)
+
+# =========================
+# Query Result Cache
+# =========================
+RESULT_CACHE_MAX_BYTES = int(os.getenv("RESULT_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+def _db_signature() -> Tuple[Any, ...]:
     """
-    Execute a SELECT-only SQL statement and return rows + columns.
+    Cheap fingerprint of the database contents: SQLite's data_version changes
+    when another connection commits, file stats catch rebuilds/replacements.
+    """
+    data_version = db_pool.data_version()
+    stats = []
+    for path in (DB_PATH, DB_PATH + "-wal"):
+        try:
+            st = os.stat(path)
+            stats.append((st.st_mtime_ns, st.st_size, st.st_ino))
+        except OSError:
+            stats.append(None)
+    return (data_version, *stats)
+
+def _estimate_result_bytes(result: Dict[str, Any]) -> int:
+    # Rough in-memory footprint; good enough to enforce a cap
+    size = 256 + sum(len(str(c)) * 4 for c in result.get("columns", []))
+    values = [v for row in result.get("rows", []) for v in row.values()]
+    values += [v for column in result.get("data", []) for v in column]
+    size += 64 * len(result.get("rows", []))
+    for value in values:
+        size += 32 + (len(value) * 4 if isinstance(value, (str, bytes)) else 8)
+    return size
+
+class ResultCache:
+    """
+    LRU cache of SELECT results keyed on the exact SQL that was executed.
+    Every entry is tagged with the database signature at execution time and
+    the whole cache is dropped as soon as that signature changes.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, Tuple[int, Dict[str, Any]]]" = OrderedDict()
+        self._signature: Optional[Tuple[Any, ...]] = None
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def _check_signature(self, signature: Tuple[Any, ...]) -> None:
+        if signature != self._signature:
+            if self._entries:
+                self.invalidations += 1
+            self._entries.clear()
+            self._bytes = 0
+            self._signature = signature
+
+    def get(self, sql: str, signature: Tuple[Any, ...]) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            self._check_signature(signature)
+            entry = self._entries.get(sql)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(sql)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, sql: str, signature: Tuple[Any, ...], result: Dict[str, Any]) -> None:
+        size = _estimate_result_bytes(result)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            self._check_signature(signature)
+            old = self._entries.pop(sql, None)
+            if old is not None:
+                self._bytes -= old[0]
+            self._entries[sql] = (size, result)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, (evicted_size, _) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+            }
+
+result_cache = ResultCache(RESULT_CACHE_MAX_BYTES)
+
+# =========================
+# Query Execution Budget
+# =========================
+# Global ceilings for a single query; 0 disables the check
+SQL_TIMEOUT_MS = int(os.getenv("SQL_TIMEOUT_MS", "5000"))
+SQL_MAX_VM_STEPS = int(os.getenv("SQL_MAX_VM_STEPS", "0"))
+
+budget_stats = {"timeout": 0, "vm_steps": 0}
+_budget_stats_lock = threading.Lock()
+
+class QueryBudget:
+    """
+    Wall-clock and VM-instruction budget for one query, enforced through
+    SQLite's progress handler. Time only accrues while SQLite is working
+    (inside running()), so a slow streaming client does not count against it.
+    """
+
+    CHECK_EVERY = 1000  # VM instructions between progress handler calls
+
+    def __init__(self, timeout_ms: int = SQL_TIMEOUT_MS, max_vm_steps: int = SQL_MAX_VM_STEPS):
+        self.timeout = timeout_ms / 1000.0
+        self.max_vm_steps = max_vm_steps
+        self.steps = 0
+        self.elapsed = 0.0
+        self.exceeded: Optional[str] = None
+        self._resumed = 0.0
+
+    @classmethod
+    def for_request(cls, timeout_ms: Optional[int], max_vm_steps: Optional[int]) -> "QueryBudget":
+        # Per-request values may tighten the global limits but never lift them
+        def pick(requested: Optional[int], ceiling: int) -> int:
+            if requested is None:
+                return ceiling
+            return min(requested, ceiling) if ceiling else requested
+        return cls(pick(timeout_ms, SQL_TIMEOUT_MS), pick(max_vm_steps, SQL_MAX_VM_STEPS))
+
+    def _check(self) -> int:
+        self.steps += self.CHECK_EVERY
+        if self.max_vm_steps and self.steps > self.max_vm_steps:
+            self.exceeded = "vm_steps"
+        elif self.timeout and self.elapsed + time.perf_counter() - self._resumed > self.timeout:
+            self.exceeded = "timeout"
+        return 1 if self.exceeded else 0
+
+    @contextmanager
+    def running(self, conn: sqlite3.Connection):
+        self._resumed = time.perf_counter()
+        conn.set_progress_handler(self._check, self.CHECK_EVERY)
+        try:
+            yield
+        finally:
+            conn.set_progress_handler(None, 0)
+            self.elapsed += time.perf_counter() - self._resumed
+
+def _execution_error(e: Exception, budget: QueryBudget) -> HTTPException:
+    # 422, not 408: the server stopped the query, and clients/proxies retry 408 automatically
+    if budget.exceeded:
+        with _budget_stats_lock:
+            budget_stats[budget.exceeded] += 1
+        limit = f"{int(budget.timeout * 1000)} ms" if budget.exceeded == "timeout" else f"{budget.max_vm_steps} steps"
+        return HTTPException(
+            status_code=422,
+            detail=f"sql_budget_exceeded: SQL execution budget exceeded ({budget.exceeded}: {limit}).",
+        )
+    return HTTPException(status_code=400, detail=f"SQL execution error: {e}")
+
+# =========================
+# Statement Parameterization
+# =========================
+# Generated SQL inlines its constants (ราคา > 500, วัสดุ LIKE '%ไม้%'), so every
+# variant would be parsed and planned from scratch. Predicate literals are
+# lifted into bound parameters so queries of the same shape share one
+# prepared statement in sqlite3's per-connection statement cache.
+SQL_PARAMETERIZE = os.getenv("SQL_PARAMETERIZE", "1") == "1"
+
+_SQL_TOKEN_RE = re.compile(r"""
+    (?P<space>\s+)
+  | (?P<comment>--[^\n]*|/\*.*?\*/)
+  | (?P<string>'(?:[^']|'')*')
+  | (?P<quoted>"(?:[^"]|"")*"|`[^`]*`|\[[^\]]*\])
+  | (?P<word>[A-Za-z_\u0E00-\u0E7F][\w\u0E00-\u0E7F$]*)
+  | (?P<number>(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?)
+  | (?P<param>[?:@$])
+  | (?P<other>.)
+""", re.S | re.X)
+
+# Clauses whose literals can be bound without changing result column names or
+# meaning (ORDER BY 1 / GROUP BY 1 are positional, select-list text names columns)
+_PARAM_CLAUSES = {"where", "having", "on", "limit", "offset"}
+_CLAUSE_KEYWORDS = {
+    "select": "select", "from": "from", "join": "from", "where": "where", "group": "group",
+    "order": "order", "having": "having", "limit": "limit", "offset": "offset", "on": "on",
+    "union": None, "intersect": None, "except": None,
+}
+
+def parameterize_sql(sql: str) -> Tuple[str, List[Any]]:
+    """
+    Replace numeric and string literals in WHERE/HAVING/ON/LIMIT/OFFSET
+    positions with ? and return (template, params). SQL that already has
+    parameters or blob literals is returned unchanged.
+    """
+    tokens = [(m.lastgroup, m.group()) for m in _SQL_TOKEN_RE.finditer(sql)]
+    if any(kind == "param" for kind, _ in tokens):
+        return sql, []
+
+    out: List[str] = []
+    params: List[Any] = []
+    levels: List[Optional[str]] = [None]   # current clause per parenthesis depth
+    prev = ""
+    for kind, text in tokens:
+        if kind == "word":
+            clause = text.lower()
+            if clause in _CLAUSE_KEYWORDS:
+                levels[-1] = _CLAUSE_KEYWORDS[clause]
+        elif kind == "other" and text == "(":
+            levels.append(None)
+        elif kind == "other" and text == ")" and len(levels) > 1:
+            levels.pop()
+        elif kind in ("number", "string"):
+            known = [c for c in levels if c is not None]
+            bindable = (
+                known and known[-1] in _PARAM_CLAUSES
+                and not any(c in ("select", "group", "order") for c in levels)
+                and prev.lower() not in ("x",)   # x'..' blob literal
+            )
+            if bindable:
+                if kind == "string":
+                    params.append(text[1:-1].replace("''", "'"))
+                else:
+                    value = float(text) if any(c in text for c in ".eE") else int(text)
+                    # SQLite reads integers beyond 64 bits as REAL
+                    params.append(float(value) if abs(value) >= 2 ** 63 else value)
+                text = "?"
+        out.append(text)
+        if kind not in ("space", "comment"):
+            prev = text
+    return "".join(out), params
+
+class StatementStats:
+    """
+    Tracks recently executed statement templates (same capacity as each
+    connection's statement cache) and how long execute() - prepare/plan plus
+    the first step - takes for repeated vs new shapes.
+    """
+
+    def __init__(self, size: int):
+        self.size = size
+        self._seen: "OrderedDict[str, None]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.reused = 0
+        self.new = 0
+        self.execute_seconds_reused = 0.0
+        self.execute_seconds_new = 0.0
+
+    def execute(self, cur: sqlite3.Cursor, sql: str, limit: Optional[int] = None) -> None:
+        template, params = parameterize_sql(sql) if SQL_PARAMETERIZE else (sql, [])
+        if limit:
+            template, params = limit_sql(template), [*params, limit]
+        started = time.perf_counter()
+        cur.execute(template, params)
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            if template in self._seen:
+                self._seen.move_to_end(template)
+                self.reused += 1
+                self.execute_seconds_reused += elapsed
+            else:
+                self._seen[template] = None
+                if len(self._seen) > self.size:
+                    self._seen.popitem(last=False)
+                self.new += 1
+                self.execute_seconds_new += elapsed
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "templates": len(self._seen),
+                "reused": self.reused,
+                "new": self.new,
+                "execute_seconds_reused": round(self.execute_seconds_reused, 6),
+                "execute_seconds_new": round(self.execute_seconds_new, 6),
+            }
+
+statement_stats = StatementStats(DB_STATEMENT_CACHE_SIZE)
+
+def limit_sql(sql: str) -> str:
+    """
+    Wrap a SELECT in an outer LIMIT ? so SQLite can plan it (top-N sort for
+    ORDER BY) instead of sorting every row and stopping the cursor afterwards.
+    The newline keeps a trailing -- comment from swallowing the parenthesis.
     """
+    return f"SELECT * FROM (\n{sql.strip().rstrip(';').rstrip()}\n) LIMIT ?"
+
+def result_columns(cur: sqlite3.Cursor, limited: bool) -> List[str]:
+    cols = [c[0] for c in cur.description] if cur.description else []
+    if not limited:
+        return cols
+    # The limit_sql subquery renames duplicate result columns to name:1, name:2, ...
+    seen = set()
+    restored = []
+    for col in cols:
+        m = re.fullmatch(r"(.*):\d+", col)
+        if m and m.group(1) in seen:
+            col = m.group(1)
+        seen.add(col)
+        restored.append(col)
+    return restored
+
+def _check_select_only(sql: str) -> None:
     # Basic safety: only allow SELECT; no multiple statements
     stripped = sql.strip().rstrip(";").lstrip("(").strip()  # tolerate surrounding parens
     if not stripped.lower().startswith("select"):
@@ -61,13 +657,134 @@ def run_select(sql: str) -> Dict[str, Any]:
     if ";" in sql.strip().rstrip(";"):
         raise HTTPException(status_code=400, detail="Multiple statements are not allowed.")
 
+def _shape_rows(cols: List[str], tuples: List[tuple], row_format: str) -> Dict[str, Any]:
+    """
+    "rows":     {"columns": [...], "rows": [{col: value}, ...]}
+    "columnar": {"columns": [...], "data": [[values of col 0], [values of col 1], ...]}
+    """
+    if row_format == "columnar":
+        data = [list(column) for column in zip(*tuples)] if tuples else [[] for _ in cols]
+        return {"columns": cols, "data": data, "row_count": len(tuples)}
+    return {"columns": cols, "rows": [dict(zip(cols, t)) for t in tuples], "row_count": len(tuples)}
+
+def _slice_rows(result: Dict[str, Any], start: int, stop: int) -> Dict[str, Any]:
+    if "data" in result:
+        data = [column[start:stop] for column in result["data"]]
+        return {"columns": result["columns"], "data": data, "row_count": len(data[0]) if data else 0}
+    rows = result["rows"][start:stop]
+    return {"columns": result["columns"], "rows": rows, "row_count": len(rows)}
+
+def run_select(
+    sql: str,
+    limit: Optional[int] = None,
+    row_format: str = "rows",
+    budget: Optional[QueryBudget] = None,
+) -> Dict[str, Any]:
+    """
+    Execute a SELECT-only SQL statement and return rows + columns.
+    At most `limit` rows are returned: the statement is wrapped in an outer
+    LIMIT (see limit_sql) and fetchmany stops the cursor as a backstop.
+    Identical SQL is served from result_cache until the database changes.
+    The query is interrupted with a 422 (sql_budget_exceeded) once it exceeds its QueryBudget.
+    """
+    _check_select_only(sql)
+
+    cache_key = f"{row_format}:{limit}:{sql}"
+    signature = _db_signature()
+    cached = result_cache.get(cache_key, signature)
+    if cached is not None:
+        return cached
+
+    budget = budget or QueryBudget()
     try:
-        cur = db_conn.execute(sql)
-        cols = [c[0] for c in cur.description] if cur.description else []
-        rows = [dict(row) for row in cur.fetchall()]
-        return {"columns": cols, "rows": rows, "row_count": len(rows)}
+        with db_pool.connection() as conn, closing(conn.cursor()) as cur, budget.running(conn):
+            cur.row_factory = None   # plain tuples; shaped below without sqlite3.Row
+            statement_stats.execute(cur, sql, limit)
+            cols = result_columns(cur, bool(limit))
+            tuples = cur.fetchmany(limit) if limit else cur.fetchall()
+            result = _shape_rows(cols, tuples, row_format)
+        result_cache.put(cache_key, signature, result)
+        return result
+    except HTTPException:
+        raise
     except Exception as e:
-        raise HTTPException(status_code=400, detail=f"SQL execution error: {e}")
+        raise _execution_error(e, budget)
+
+def iter_select(
+    sql: str,
+    chunk_size: int,
+    limit: Optional[int] = None,
+    row_format: str = "rows",
+    budget: Optional[QueryBudget] = None,
+):
+    """
+    Streaming counterpart of run_select: yields the column names, then
+    _shape_rows() chunks of up to chunk_size rows pulled with fetchmany, so only
+    one chunk is in memory at a time, stopping after `limit` rows (also applied
+    in SQL through limit_sql). The pooled
+    connection is held until the generator is exhausted or closed. Results are
+    not added to result_cache.
+    """
+    _check_select_only(sql)
+
+    cached = result_cache.get(f"{row_format}:{limit}:{sql}", _db_signature())
+    if cached is not None:
+        yield cached["columns"]
+        for start in range(0, cached["row_count"], chunk_size):
+            yield _slice_rows(cached, start, start + chunk_size)
+        return
+
+    budget = budget or QueryBudget()
+    with db_pool.connection() as conn:
+        cur = None
+        try:
+            cur = conn.cursor()
+            cur.row_factory = None
+            with budget.running(conn):
+                statement_stats.execute(cur, sql, limit)
+            cols = result_columns(cur, bool(limit))
+            yield cols
+            remaining = limit or float("inf")
+            while remaining > 0:
+                with budget.running(conn):
+                    batch = cur.fetchmany(int(min(chunk_size, remaining)))
+                if not batch:
+                    break
+                remaining -= len(batch)
+                yield _shape_rows(cols, batch, row_format)
+        except GeneratorExit:
+            raise
+        except Exception as e:
+            raise _execution_error(e, budget)
+        finally:
+            if cur is not None:
+                cur.close()
+
+async def aiter_select(
+    sql: str,
+    chunk_size: int,
+    limit: Optional[int] = None,
+    row_format: str = "rows",
+    budget: Optional[QueryBudget] = None,
+):
+    """
+    Drive iter_select on db_executor without blocking the event loop. The
+    connection is reserved up front and its reservation freed once the
+    generator has been closed on db_executor.
+    """
+    await db_pool.reserve()
+    loop = asyncio.get_running_loop()
+    gen = iter_select(sql, chunk_size, limit, row_format, budget)
+    done = object()
+    try:
+        while True:
+            item = await run_in_db_executor(next, gen, done)
+            if item is done:
+                break
+            yield item
+    finally:
+        # Return the connection even if the client went away mid-stream
+        _release_when_done(db_executor.submit(gen.close), loop)
 
 # =========================
 # Prompt Templates
@@ -75,42 +792,11 @@ def run_select(sql: str) -> Dict[str, Any]:
 SQL_GENERATION_PROMPT = """
 You are a senior SQL expert. Convert the user's natural language question into a SQL query for a SQLite database with this schema:
 
-TABLE สินค้า (
-  รหัสสินค้า TEXT PRIMARY KEY,
-  ชื่อสินค้า TEXT NOT NULL,
-  หมวดหมู่ TEXT NOT NULL,        -- e.g., 'ห้องนั่งเล่น', 'ห้องนอน', 'ห้องทานอาหาร', 'สำนักงาน', 'จัดเก็บ'
-  วัสดุ TEXT,
-  ความยาว_นิ้ว INTEGER,
-  ความกว้าง_นิ้ว INTEGER,
-  ความสูง_นิ้ว INTEGER,
-  สี TEXT,
-  ราคา REAL NOT NULL,
-  น้ำหนัก_ปอนด์ REAL,
-  ต้องประกอบ BOOLEAN,          -- 1 = ต้องประกอบ, 0 = ไม่ต้องประกอบ
-  การรับประกัน_ปี INTEGER,
-  จำนวนสต็อก INTEGER NOT NULL,
-  สถานะสต็อก TEXT,            -- e.g., 'มีสินค้า', 'สต็อกน้อย'
-  วันที่สร้าง DATE DEFAULT CURRENT_DATE,
-  อัปเดตล่าสุด TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-);
-
-TABLE หมวดหมู่ (
-  ชื่อหมวดหมู่ TEXT PRIMARY KEY,
-  คำอธิบาย TEXT,
-  วันที่สร้าง DATE DEFAULT CURRENT_DATE
-);
+{schema}
 
 Guidelines:
 - SQLite-compatible SQL only.
-- Use JOINs when needed: สินค้า.หมวดหมู่ = หมวดหมู่.ชื่อหมวดหมู่.
-- For substring search (e.g., วัสดุ contains ไม้), use: วัสดุ LIKE '%ไม้%'.
-- For price ranges, use appropriate comparison operators: ราคา > 500, ราคา BETWEEN 100 AND 1000.
-- For assembly status: ต้องประกอบ = 1 (requires assembly), ต้องประกอบ = 0 (no assembly).
-- For stock status: สถานะสต็อก = 'สต็อกน้อย' or สถานะสต็อก = 'มีสินค้า'.
-- Calculate percentages using: ROUND(100.0 * COUNT(*) / (SELECT COUNT(*) FROM สินค้า), 2).
-- For inventory value calculations: ราคา * จำนวนสต็อก.
-- Common categories: 'ห้องนั่งเล่น', 'ห้องนอน', 'ห้องทานอาหาร', 'สำนักงาน', 'จัดเก็บ'.
-- Common materials: 'ไม้โอ๊ค', 'หนังแท้', 'เหล็ก', 'กระจก', 'ผ้า', 'ไม้สน', 'วอลนัท'.
+{guidelines}
 - If ambiguous, choose the most reasonable interpretation for furniture retail business.
 
 Respond ONLY with a valid SQL query. No explanation, no markdown, no extra text - just the SQL query.
@@ -131,56 +817,594 @@ Provide a clear, concise explanation of what the results show in relation to the
 Use Thai language when appropriate and keep the explanation conversational and accessible to retail managers and non-technical users.
 """.strip()
 
-# # Example usage patterns for common furniture queries:
-
-# EXAMPLE_QUERIES = {
-#     "category_analysis": """
-#     -- สินค้าในแต่ละหมวดหมู่มีกี่ชิ้น
-#     SELECT หมวดหมู่, COUNT(*) as จำนวนสินค้า, 
-#            ROUND(AVG(ราคา), 2) as ราคาเฉลี่ย
-#     FROM สินค้า 
-#     GROUP BY หมวดหมู่ 
-#     ORDER BY จำนวนสินค้า DESC;
-#     """,
-    
-#     "assembly_analysis": """
-#     -- สินค้าที่ต้องประกอบ vs ไม่ต้องประกอบ
-#     SELECT 
-#         CASE WHEN ต้องประกอบ = 1 THEN 'ต้องประกอบ' ELSE 'ไม่ต้องประกอบ' END as การประกอบ,
-#         COUNT(*) as จำนวน,
-#         ROUND(AVG(ราคา), 2) as ราคาเฉลี่ย
-#     FROM สินค้า 
-#     GROUP BY ต้องประกอบ;
-#     """,
-    
-#     "premium_products": """
-#     -- สินค้าราคาสูงและการรับประกันยาว
-#     SELECT ชื่อสินค้า, หมวดหมู่, ราคา, การรับประกัน_ปี
-#     FROM สินค้า 
-#     WHERE ราคา > 500 AND การรับประกัน_ปี > 2
-#     ORDER BY ราคา DESC;
-#     """,
-    
-#     "stock_status": """
-#     -- การวิเคราะห์สถานะสต็อก
-#     SELECT สถานะสต็อก, 
-#            COUNT(*) as จำนวนรายการ,
-#            ROUND(100.0 * COUNT(*) / (SELECT COUNT(*) FROM สินค้า), 2) as เปอร์เซ็นต์
-#     FROM สินค้า 
-#     GROUP BY สถานะสต็อก;
-#     """,
-    
-#     "inventory_value": """
-#     -- มูลค่าสต็อกรวม
-#     SELECT 
-#         หมวดหมู่,
-#         SUM(ราคา * จำนวนสต็อก) as มูลค่าสต็อกรวม,
-#         AVG(ราคา) as ราคาเฉลี่ย
-#     FROM สินค้า 
-#     GROUP BY หมวดหมู่ 
-#     ORDER BY มูลค่าสต็อกรวม DESC;
-#     """
-# }
+# Each line is emitted only when every table / table.column it names is in the prompt schema
+COLUMN_GUIDELINES = [
+    ({"สินค้า.หมวดหมู่", "หมวดหมู่.ชื่อหมวดหมู่"}, "- Use JOINs when needed: สินค้า.หมวดหมู่ = หมวดหมู่.ชื่อหมวดหมู่."),
+    ({"สินค้า.ราคา"}, "- For price ranges, use appropriate comparison operators: ราคา > 500, ราคา BETWEEN 100 AND 1000."),
+    ({"สินค้า.ต้องประกอบ"}, "- For assembly status: ต้องประกอบ = 1 (requires assembly), ต้องประกอบ = 0 (no assembly)."),
+    ({"สินค้า.สถานะสต็อก"}, "- For stock status: สถานะสต็อก = 'สต็อกน้อย' or สถานะสต็อก = 'มีสินค้า'."),
+    ({"สินค้า"}, "- Calculate percentages using: ROUND(100.0 * COUNT(*) / (SELECT COUNT(*) FROM สินค้า), 2)."),
+    ({"สินค้า.ราคา", "สินค้า.จำนวนสต็อก"}, "- For inventory value calculations: ราคา * จำนวนสต็อก."),
+]
+# "Common ..." value lists, emitted when their column is in the prompt schema. None takes
+# the column's introspected values; วัสดุ holds free-text descriptions ('หนังแท้, กลไกเหล็ก'),
+# so its raw values would steer the model toward exact matches and the list is curated.
+VALUE_GUIDELINES = {
+    ("สินค้า", "หมวดหมู่"): ("Common categories", None),
+    ("สินค้า", "วัสดุ"): ("Common materials", ["ไม้โอ๊ค", "หนังแท้", "เหล็ก", "กระจก", "ผ้า", "ไม้สน", "วอลนัท"]),
+}
+LIKE_SEARCH_GUIDELINE = "- For substring search (e.g., วัสดุ contains ไม้), use: วัสดุ LIKE '%ไม้%'."
+FTS_SEARCH_GUIDELINE = """
+- For substring search in {columns} (e.g., วัสดุ contains ไม้), use the full-text index instead of LIKE:
+  {content}.rowid IN (SELECT rowid FROM {fts} WHERE {fts} MATCH 'วัสดุ:"ไม้"').
+  Combine terms inside one MATCH string: 'วัสดุ:"ไม้" AND สี:"ขาว"'. Search terms must be at least
+  3 characters; for shorter terms use LIKE '%...%' on {content}.
+""".strip()
+SUMMARY_GUIDELINE = """
+- Totals, counts and averages per {keys} over ALL products are precomputed in {tables}
+  (one row per group, kept current by triggers); read them instead of aggregating สินค้า, e.g.
+  SELECT {key}, จำนวนสินค้า, ROUND(ผลรวมราคา / จำนวนสินค้า, 2) AS ราคาเฉลี่ย FROM {table}.
+  Aggregate สินค้า directly only when the question filters products (material, price range, ...).
+""".strip()
+
+# =========================
+# Schema Introspection
+# =========================
+# The {schema} section of SQL_GENERATION_PROMPT is built from the live database.
+# Notes/aliases below add what sqlite_master cannot tell the model or the pruner.
+COLUMN_NOTES = {
+    ("สินค้า", "หมวดหมู่"): "e.g., 'ห้องนั่งเล่น', 'ห้องนอน', 'ห้องทานอาหาร', 'สำนักงาน', 'จัดเก็บ'",
+    ("สินค้า", "ต้องประกอบ"): "1 = ต้องประกอบ, 0 = ไม่ต้องประกอบ",
+    ("สินค้า", "สถานะสต็อก"): "e.g., 'มีสินค้า', 'สต็อกน้อย'",
+    ("สรุป_หมวดหมู่", "ผลรวมราคา"): "SUM(ราคา); average price = ผลรวมราคา / จำนวนสินค้า",
+    ("สรุป_หมวดหมู่", "มูลค่าสต็อกรวม"): "SUM(ราคา * จำนวนสต็อก)",
+    ("สรุป_หมวดหมู่", "จำนวนต้องประกอบ"): "products with ต้องประกอบ = 1",
+    ("สรุป_หมวดหมู่", "ผลรวมราคาต้องประกอบ"): "SUM(ราคา) of products with ต้องประกอบ = 1",
+    ("สรุป_สถานะสต็อก", "ผลรวมราคา"): "SUM(ราคา); average price = ผลรวมราคา / จำนวนสินค้า",
+    ("สรุป_สถานะสต็อก", "มูลค่าสต็อกรวม"): "SUM(ราคา * จำนวนสต็อก)",
+}
+# Trigger-maintained aggregates of สินค้า (see build_furniture_db.py), by their GROUP BY column
+SUMMARY_TABLES = {"สรุป_หมวดหมู่": "หมวดหมู่", "สรุป_สถานะสต็อก": "สถานะสต็อก"}
+# Bookkeeping tables of build_furniture_db.py --sync; never shown to the model
+INTERNAL_TABLES = {"แฮชสินค้า"}
+# English/colloquial words that should select a table or column during pruning
+SCHEMA_ALIASES = {
+    "สินค้า": ["product", "item", "furniture", "เฟอร์นิเจอร์", "ชิ้น"],
+    "หมวดหมู่": ["category", "categories", "หมวด"],
+    "ชื่อหมวดหมู่": ["category", "หมวด"],
+    "ชื่อสินค้า": ["name"],
+    "วัสดุ": ["material", "ทำจาก", "ไม้", "หนัง", "เหล็ก", "ผ้า", "กระจก"],
+    "ความยาว_นิ้ว": ["length", "size", "ขนาด"],
+    "ความกว้าง_นิ้ว": ["width", "size", "ขนาด"],
+    "ความสูง_นิ้ว": ["height", "size", "ขนาด"],
+    "สี": ["color", "colour"],
+    "ราคา": ["price", "cost", "บาท", "แพง", "ถูก", "มูลค่า"],
+    "น้ำหนัก_ปอนด์": ["weight", "หนัก", "ปอนด์"],
+    "ต้องประกอบ": ["assembly", "assemble", "ประกอบ"],
+    "การรับประกัน_ปี": ["warranty", "รับประกัน"],
+    "จำนวนสต็อก": ["stock", "inventory", "สต็อก", "คงเหลือ", "มูลค่า"],
+    "สถานะสต็อก": ["stock", "status", "สต็อก", "สถานะ"],
+    "วันที่สร้าง": ["created", "date", "วันที่"],
+    "อัปเดตล่าสุด": ["updated", "อัปเดต"],
+}
+SCHEMA_PRUNING = os.getenv("SCHEMA_PRUNING", "1") == "1"
+# Text columns with at most this many distinct values are treated as enumerations
+SCHEMA_ENUM_MAX_VALUES = int(os.getenv("SCHEMA_ENUM_MAX_VALUES", "12"))
+
+_schema: Optional[List[Dict[str, Any]]] = None
+_schema_lock = threading.Lock()
+prompt_stats = {"requests": 0, "pruned": 0, "prompt_chars": 0, "prompt_tokens_est": 0, "prompt_tokens": 0}
+_prompt_stats_lock = threading.Lock()
+
+def introspect_schema() -> List[Dict[str, Any]]:
+    """
+    Read tables/columns from sqlite_master + PRAGMA table_info once and cache them
+    (called from the startup hook). Low-cardinality text columns also keep their
+    distinct values for prompt hints and lexical matching.
+    """
+    global _schema
+    with _schema_lock:
+        if _schema is not None:
+            return _schema
+        tables = []
+        with db_pool.connection() as conn:
+            entries = conn.execute(
+                "SELECT name, sql FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%' ORDER BY rowid;"
+            ).fetchall()
+            # FTS5 tables are described as a search index; their shadow tables are hidden
+            virtual = {name: sql for name, sql in entries if (sql or "").upper().startswith("CREATE VIRTUAL TABLE")}
+            for table, _ in entries:
+                if table in INTERNAL_TABLES or any(table.startswith(v + "_") for v in virtual):
+                    continue
+                columns = []
+                for _, name, col_type, notnull, default, pk in conn.execute(f'PRAGMA table_info("{table}");'):
+                    values: List[str] = []
+                    if (col_type or "").upper() == "TEXT" and not pk and table not in virtual:
+                        distinct = [r[0] for r in conn.execute(
+                            f'SELECT DISTINCT "{name}" FROM "{table}" WHERE "{name}" IS NOT NULL LIMIT ?;',
+                            (SCHEMA_ENUM_MAX_VALUES + 1,),
+                        )]
+                        # Only short labels (categories, statuses) are useful as hints
+                        if len(distinct) <= SCHEMA_ENUM_MAX_VALUES and all(len(str(v)) <= 40 for v in distinct):
+                            values = [str(v) for v in distinct]
+                    columns.append({
+                        "name": name, "type": col_type, "notnull": bool(notnull),
+                        "default": default, "pk": bool(pk), "values": values,
+                    })
+                entry = {"name": table, "columns": columns}
+                if table in virtual:
+                    content = re.search(r"content\s*=\s*'([^']+)'", virtual[table])
+                    entry["fts"] = {"content": content.group(1) if content else None}
+                tables.append(entry)
+        _schema = tables
+        return _schema
+
+def render_schema(tables: List[Dict[str, Any]]) -> str:
+    blocks = []
+    for table in tables:
+        if "fts" in table:
+            columns = ", ".join(c["name"] for c in table["columns"])
+            source = table["fts"]["content"]
+            note = f"    -- full-text index of {source}, rowid = {source}.rowid" if source else ""
+            blocks.append(f"VIRTUAL TABLE {table['name']} USING fts5({columns});{note}")
+            continue
+        lines = []
+        for col in table["columns"]:
+            line = f"  {col['name']} {col['type']}".rstrip()
+            if col["pk"]:
+                line += " PRIMARY KEY"
+            if col["notnull"]:
+                line += " NOT NULL"
+            if col["default"] is not None:
+                line += f" DEFAULT {col['default']}"
+            note = COLUMN_NOTES.get((table["name"], col["name"]))
+            if note is None and col["values"]:
+                note = "values: " + ", ".join(f"'{v}'" for v in col["values"])
+            lines.append((line, note))
+        body = []
+        for i, (line, note) in enumerate(lines):
+            line += "," if i < len(lines) - 1 else ""
+            body.append(f"{line}    -- {note}" if note else line)
+        blocks.append(f"TABLE {table['name']} (\n" + "\n".join(body) + "\n);")
+    return "\n\n".join(blocks)
+
+def _schema_terms(name: str, values: List[str]) -> List[str]:
+    terms = [name, *name.split("_"), *SCHEMA_ALIASES.get(name, []), *values]
+    return [normalize_question(t) for t in terms if len(t) >= 2]
+
+def prune_schema(question: str, tables: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Keep only the tables/columns whose name, alias or known values appear in the
+    question (plus keys and NOT NULL columns of kept tables). Falls back to the
+    full schema when nothing matches.
+    """
+    text = normalize_question(question)
+    pruned = []
+    for table in tables:
+        table_hit = any(t in text for t in _schema_terms(table["name"], []))
+        hits = [c for c in table["columns"] if any(t in text for t in _schema_terms(c["name"], c["values"]))]
+        if not table_hit and not hits:
+            continue
+        if "fts" in table:
+            if hits:
+                pruned.append(table)
+            continue
+        if table["name"] in SUMMARY_TABLES:
+            pruned.append(table)
+            continue
+        keep = [c for c in table["columns"] if c["pk"] or c["notnull"] or c in hits]
+        pruned.append({"name": table["name"], "columns": keep})
+    return pruned or tables
+
+def build_sql_prompt(question: str) -> str:
+    tables = introspect_schema()
+    selected = prune_schema(question, tables) if SCHEMA_PRUNING else tables
+    prompt = SQL_GENERATION_PROMPT.format(
+        schema=render_schema(selected),
+        guidelines=schema_guidelines(selected),
+    )
+    with _prompt_stats_lock:
+        prompt_stats["requests"] += 1
+        prompt_stats["pruned"] += selected is not tables
+        prompt_stats["prompt_chars"] += len(prompt)
+        prompt_stats["prompt_tokens_est"] += estimate_tokens(prompt)
+    return prompt
+
+def search_index(tables: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    return next((t for t in tables if "fts" in t and t["fts"]["content"]), None)
+
+def has_table(name: str) -> bool:
+    return any(t["name"] == name for t in introspect_schema())
+
+def schema_names(tables: List[Dict[str, Any]]) -> set:
+    names = set()
+    for table in tables:
+        names.add(table["name"])
+        names.update(f"{table['name']}.{c['name']}" for c in table["columns"])
+    return names
+
+def schema_guidelines(tables: List[Dict[str, Any]]) -> str:
+    """
+    Guideline lines for the (possibly pruned) prompt schema: none of them names
+    a table or column the model was not shown.
+    """
+    names = schema_names(tables)
+    lines = [line for required, line in COLUMN_GUIDELINES if required <= names]
+    table_lines = table_guidelines(tables)
+    if table_lines:
+        lines.append(table_lines)
+    for table in tables:
+        for col in table["columns"]:
+            label, values = VALUE_GUIDELINES.get((table["name"], col["name"]), (None, None))
+            values = values or col.get("values")
+            if label and values:
+                lines.append(f"- {label}: " + ", ".join(f"'{v}'" for v in values) + ".")
+    return "\n".join(lines)
+
+def table_guidelines(tables: List[Dict[str, Any]]) -> str:
+    """
+    Guideline lines that depend on which search/summary tables the prompt schema includes.
+    """
+    fts = search_index(tables)
+    lines = []
+    if fts is None:
+        if "สินค้า.วัสดุ" in schema_names(tables):
+            lines.append(LIKE_SEARCH_GUIDELINE)
+    else:
+        lines.append(FTS_SEARCH_GUIDELINE.format(
+            columns=", ".join(c["name"] for c in fts["columns"]),
+            content=fts["fts"]["content"],
+            fts=fts["name"],
+        ))
+    summaries = [t["name"] for t in tables if t["name"] in SUMMARY_TABLES]
+    if summaries:
+        lines.append(SUMMARY_GUIDELINE.format(
+            keys=" / ".join(SUMMARY_TABLES[name] for name in summaries),
+            tables=" / ".join(summaries),
+            key=SUMMARY_TABLES[summaries[0]],
+            table=summaries[0],
+        ))
+    return "\n".join(lines)
+
+def estimate_tokens(text: str) -> int:
+    # ~4 bytes per token holds roughly for both Latin and UTF-8 Thai text
+    return max(1, len(text.encode("utf-8")) // 4)
+
+def record_prompt_usage(model_output: Dict[str, Any]) -> None:
+    usage = model_output.get("usage") or {}
+    with _prompt_stats_lock:
+        prompt_stats["prompt_tokens"] += usage.get("prompt_tokens") or 0
+
+# =========================
+# Intent Router
+# =========================
+# Common analytics questions are answered from parameterized SQL templates
+# without a model round trip. A template is used only when every required
+# keyword group is present, every slot found in the question can be applied,
+# and the question mentions no column or number the template does not handle.
+# Negations and rankings (ไม่ใช่ไม้, ราคาสูงสุด), several values for one slot
+# (ห้องนอนหรือห้องนั่งเล่น), leftover comparisons and aggregates the template
+# does not compute would be silently dropped, so those questions go to the model.
+INTENT_ROUTER = os.getenv("INTENT_ROUTER", "1") == "1"
+INTENT_MIN_CONFIDENCE = float(os.getenv("INTENT_MIN_CONFIDENCE", "1.0"))
+
+CATEGORY_TERMS = {
+    "ห้องนั่งเล่น": "ห้องนั่งเล่น", "living room": "ห้องนั่งเล่น",
+    "ห้องนอน": "ห้องนอน", "bedroom": "ห้องนอน",
+    "ห้องทานอาหาร": "ห้องทานอาหาร", "dining": "ห้องทานอาหาร",
+    "สำนักงาน": "สำนักงาน", "office": "สำนักงาน",
+    "จัดเก็บ": "จัดเก็บ", "storage": "จัดเก็บ",
+}
+MATERIAL_TERMS = {
+    "ไม้โอ๊ค": "ไม้โอ๊ค", "oak": "โอ๊ค", "ไม้สน": "ไม้สน", "pine": "สน",
+    "วอลนัท": "วอลนัท", "walnut": "วอลนัท", "ไผ่": "ไผ่", "bamboo": "ไผ่",
+    "หนังแท้": "หนังแท้", "หนังเทียม": "หนังเทียม", "หนัง": "หนัง", "leather": "หนัง",
+    "เหล็ก": "เหล็ก", "steel": "เหล็ก", "metal": "เหล็ก", "กระจก": "กระจก", "glass": "กระจก",
+    "หินอ่อน": "หินอ่อน", "marble": "หินอ่อน", "ผ้า": "ผ้า", "fabric": "ผ้า",
+    "ไม้": "ไม้", "wood": "ไม้",
+}
+# Product types are not a slot; a question naming one needs the model
+PRODUCT_TYPE_TERMS = ["โต๊ะ", "เก้าอี้", "โซฟา", "เตียง", "ตู้", "ชั้น", "table", "chair", "sofa", "bed", "desk", "cabinet", "shelf"]
+STOCK_STATUS_TERMS = {"สต็อกน้อย": "สต็อกน้อย", "low stock": "สต็อกน้อย", "in stock": "มีสินค้า"}
+# Matched against the normalized question, where Thai and Latin words may touch
+INTENT_BLOCKER_RE = re.compile(
+    r"ไม่|ยกเว้น|เว้นแต่|นอกจาก|ปราศจาก"                  # negation
+    r"|สุด|อันดับ|เรียง"                                  # สูงสุด/ต่ำสุด/แพงที่สุด, ranking, sorting
+    r"|(?<![a-z])(?:not|no|non|except|excluding|exclude|without|other than)(?![a-z])"
+    r"|[a-z]n t(?![a-z])"                                 # isn't, aren't, don't (apostrophe folded)
+    r"|(?<![a-z])(?:top|max|min|cheapest|highest|lowest|most|least|sort|order by|rank)"
+)
+# Negated phrases whose meaning a slot pattern already captures ("ราคาไม่เกิน 1000 บาท")
+INTENT_SAFE_PHRASES = ["ไม่เกิน"]
+# A comparison the price slot did not consume ("สต็อกน้อยกว่าสิบชิ้น") is a filter no template applies
+COMPARISON_RE = re.compile(
+    r"มากกว่า|น้อยกว่า|สูงกว่า|ต่ำกว่า|เกิน|เท่ากับ"
+    r"|(?<![a-z])(?:over|under|above|below|less than|more than|greater than|at least|at most)(?![a-z])"
+)
+# Aggregates a question can ask for; each template lists the ones its SQL computes
+AGGREGATE_TERMS = {
+    "count": re.compile(r"กี่|จำนวน(?!สต็อก)|(?<![a-z])(?:how many|count)"),
+    "average": re.compile(r"เฉลี่ย|(?<![a-z])(?:average|avg|mean)(?![a-z])"),
+    "sum": re.compile(r"รวม|(?<![a-z])(?:total|sum)(?![a-z])"),
+    "percent": re.compile(r"สัดส่วน|เปอร์เซ็นต์|(?<![a-z])percent"),
+}
+# Slot terms joined by a conjunction ("ไม้โอ๊คหรือสัก", "oak and teak") ask for more than one value
+_CONJUNCTION_BEFORE_RE = re.compile(r"(?:หรือ|และ|(?<![a-z])(?:or|and))\s*$")
+_CONJUNCTION_AFTER_RE = re.compile(r"\s*(?:หรือ|และ|(?:or|and)(?![a-z]))")
+
+_NUM = r"(\d[\d,]*(?:\.\d+)?)"
+_PRICE = r"(?:ราคา|price)[^\d]{0,20}?"
+# "ไม่เกิน" (not over) is an upper bound; the > patterns must not match its "เกิน"
+PRICE_PATTERNS = [
+    ("between", re.compile(_PRICE + r"(?:ระหว่าง|between)\s*" + _NUM + r"\s*(?:-|ถึง|และ|and|to)\s*" + _NUM)),
+    (">", re.compile(_PRICE + r"(?:มากกว่า|สูงกว่า|(?<!ไม่)เกิน|over|above|more than|greater than)\s*" + _NUM)),
+    ("<", re.compile(_PRICE + r"(?:น้อยกว่า|ต่ำกว่า|ไม่เกิน|under|below|less than)\s*" + _NUM)),
+    (">", re.compile(r"(?:มากกว่า|สูงกว่า|(?<!ไม่)เกิน|over|above|more than)\s*" + _NUM + r"\s*(?:บาท|baht)")),
+    ("<", re.compile(r"(?:น้อยกว่า|ต่ำกว่า|ไม่เกิน|under|below|less than)\s*" + _NUM + r"\s*(?:บาท|baht)")),
+]
+
+def _sql_text(value: str) -> str:
+    return "'" + value.replace("'", "''") + "'"
+
+def _term_pattern(terms: Dict[str, str]) -> re.Pattern:
+    # Longest first, so "หนังแท้" is not also read as "หนัง"; "สต็อกน้อยกว่า" is a comparison, not a status
+    return re.compile("(?:" + "|".join(re.escape(t) for t in sorted(terms, key=len, reverse=True)) + ")(?!กว่า)")
+
+SLOT_TERMS = [
+    ("category", CATEGORY_TERMS, _term_pattern(CATEGORY_TERMS)),
+    ("stock_status", STOCK_STATUS_TERMS, _term_pattern(STOCK_STATUS_TERMS)),
+    ("material", MATERIAL_TERMS, _term_pattern(MATERIAL_TERMS)),
+]
+
+def _match_terms(text: str, terms: Dict[str, str], pattern: re.Pattern) -> Tuple[List[str], bool, str]:
+    """
+    Distinct slot values named in text, whether any of their terms is joined to
+    another word by a conjunction, and the text with the matched terms removed.
+    """
+    values, joined = [], False
+    for m in pattern.finditer(text):
+        if terms[m.group()] not in values:
+            values.append(terms[m.group()])
+        joined = joined or bool(_CONJUNCTION_BEFORE_RE.search(text, 0, m.start()) or _CONJUNCTION_AFTER_RE.match(text, m.end()))
+    return values, joined, pattern.sub(" ", text)
+
+def extract_slots(text: str) -> Tuple[Dict[str, Any], str]:
+    """
+    Pull category / material / stock status / price range out of a normalized
+    question. Returns the slots and the text with matched spans removed, so the
+    caller can see whether anything unexplained (e.g. other numbers) is left.
+    A slot named with several values, or joined to other words by หรือ/และ/or/and,
+    is listed under "ambiguous" instead: one equality filter cannot answer it.
+    """
+    slots: Dict[str, Any] = {}
+    for op, pattern in PRICE_PATTERNS:
+        m = pattern.search(text)
+        if m:
+            values = [float(v.replace(",", "")) for v in m.groups()]
+            slots["price"] = (op, values)
+            text = text[:m.start()] + " " + text[m.end():]
+            break
+    for slot, terms, pattern in SLOT_TERMS:
+        values, joined, text = _match_terms(text, terms, pattern)
+        if len(values) > 1 or joined:
+            slots.setdefault("ambiguous", []).append(slot)
+        elif values:
+            slots[slot] = values[0]
+    return slots, text
+
+def text_search_condition(column: str, term: str) -> str:
+    """
+    Substring match on a สินค้า column: through the FTS5 trigram index when the
+    database has one covering the column, else LIKE. Trigrams need 3+ characters.
+    """
+    fts = search_index(introspect_schema())
+    if fts is not None and len(term) >= 3 and any(c["name"] == column for c in fts["columns"]):
+        match = column + ':"' + term.replace('"', '""') + '"'
+        return f"rowid IN (SELECT rowid FROM {fts['name']} WHERE {fts['name']} MATCH {_sql_text(match)})"
+    return f"{column} LIKE {_sql_text('%' + term + '%')}"
+
+def slot_conditions(slots: Dict[str, Any]) -> List[str]:
+    conditions = []
+    if "category" in slots:
+        conditions.append(f"หมวดหมู่ = {_sql_text(slots['category'])}")
+    if "material" in slots:
+        conditions.append(text_search_condition("วัสดุ", slots["material"]))
+    if "stock_status" in slots:
+        conditions.append(f"สถานะสต็อก = {_sql_text(slots['stock_status'])}")
+    if "price" in slots:
+        op, values = slots["price"]
+        if op == "between":
+            conditions.append(f"ราคา BETWEEN {min(values):g} AND {max(values):g}")
+        else:
+            conditions.append(f"ราคา {op} {values[0]:g}")
+    return conditions
+
+def _where(slots: Dict[str, Any]) -> str:
+    conditions = slot_conditions(slots)
+    return ("\nWHERE " + " AND ".join(conditions)) if conditions else ""
+
+def _summary_where(slots: Dict[str, Any], table: str, allowed: set) -> Optional[str]:
+    """
+    WHERE clause for answering from a summary table, or None when it is missing
+    or the slots filter on something it does not group by.
+    """
+    if not set(slots) <= allowed or not has_table(table):
+        return None
+    return _where(slots)
+
+def _category_summary_sql(slots: Dict[str, Any]) -> str:
+    if _summary_where(slots, "สรุป_หมวดหมู่", set()) is not None:
+        return (
+            "SELECT หมวดหมู่, จำนวนสินค้า, ROUND(ผลรวมราคา / จำนวนสินค้า, 2) AS ราคาเฉลี่ย,\n"
+            "       สต็อกรวม, ROUND(มูลค่าสต็อกรวม, 2) AS มูลค่าสต็อกรวม\n"
+            "FROM สรุป_หมวดหมู่\nORDER BY จำนวนสินค้า DESC;"
+        )
+    return (
+        "SELECT หมวดหมู่, COUNT(*) AS จำนวนสินค้า, ROUND(AVG(ราคา), 2) AS ราคาเฉลี่ย,\n"
+        "       SUM(จำนวนสต็อก) AS สต็อกรวม, ROUND(SUM(ราคา * จำนวนสต็อก), 2) AS มูลค่าสต็อกรวม\n"
+        f"FROM สินค้า{_where(slots)}\nGROUP BY หมวดหมู่\nORDER BY จำนวนสินค้า DESC;"
+    )
+
+def _assembly_summary_sql(slots: Dict[str, Any]) -> str:
+    where = _summary_where(slots, "สรุป_หมวดหมู่", {"category"})
+    if where is not None:
+        return (
+            "SELECT * FROM (\n"
+            "  SELECT 'ไม่ต้องประกอบ' AS การประกอบ, SUM(จำนวนสินค้า - จำนวนต้องประกอบ) AS จำนวน,\n"
+            "         ROUND(SUM(ผลรวมราคา - ผลรวมราคาต้องประกอบ) / SUM(จำนวนสินค้า - จำนวนต้องประกอบ), 2) AS ราคาเฉลี่ย\n"
+            f"  FROM สรุป_หมวดหมู่{where}\n"
+            "  UNION ALL\n"
+            "  SELECT 'ต้องประกอบ', SUM(จำนวนต้องประกอบ), ROUND(SUM(ผลรวมราคาต้องประกอบ) / SUM(จำนวนต้องประกอบ), 2)\n"
+            f"  FROM สรุป_หมวดหมู่{where}\n"
+            ") WHERE จำนวน > 0;"
+        )
+    return (
+        "SELECT CASE WHEN ต้องประกอบ = 1 THEN 'ต้องประกอบ' ELSE 'ไม่ต้องประกอบ' END AS การประกอบ,\n"
+        "       COUNT(*) AS จำนวน, ROUND(AVG(ราคา), 2) AS ราคาเฉลี่ย\n"
+        f"FROM สินค้า{_where(slots)}\nGROUP BY ต้องประกอบ;"
+    )
+
+def _stock_status_summary_sql(slots: Dict[str, Any]) -> str:
+    if _summary_where(slots, "สรุป_สถานะสต็อก", set()) is not None:
+        return (
+            "SELECT สถานะสต็อก, จำนวนสินค้า AS จำนวนรายการ, สต็อกรวม AS ชิ้นรวม,\n"
+            "       ROUND(100.0 * จำนวนสินค้า / (SELECT SUM(จำนวนสินค้า) FROM สรุป_สถานะสต็อก), 2) AS เปอร์เซ็นต์\n"
+            "FROM สรุป_สถานะสต็อก;"
+        )
+    return (
+        "SELECT สถานะสต็อก, COUNT(*) AS จำนวนรายการ, SUM(จำนวนสต็อก) AS ชิ้นรวม,\n"
+        f"       ROUND(100.0 * COUNT(*) / (SELECT COUNT(*) FROM สินค้า{_where(slots)}), 2) AS เปอร์เซ็นต์\n"
+        f"FROM สินค้า{_where(slots)}\nGROUP BY สถานะสต็อก;"
+    )
+
+def _inventory_value_sql(slots: Dict[str, Any]) -> str:
+    for table, allowed in (("สรุป_หมวดหมู่", {"category"}), ("สรุป_สถานะสต็อก", {"stock_status"})):
+        where = _summary_where(slots, table, allowed)
+        if where is not None:
+            return (
+                "SELECT IFNULL(SUM(จำนวนสินค้า), 0) AS จำนวนสินค้า, SUM(สต็อกรวม) AS สต็อกรวม,\n"
+                "       ROUND(SUM(มูลค่าสต็อกรวม), 2) AS มูลค่าสต็อกรวม\n"
+                f"FROM {table}{where};"
+            )
+    return (
+        "SELECT COUNT(*) AS จำนวนสินค้า, SUM(จำนวนสต็อก) AS สต็อกรวม,\n"
+        "       ROUND(SUM(ราคา * จำนวนสต็อก), 2) AS มูลค่าสต็อกรวม\n"
+        f"FROM สินค้า{_where(slots)};"
+    )
+
+# Columns every template tolerates being mentioned (their names overlap common words)
+_ALWAYS_COVERED = {"รหัสสินค้า", "ชื่อสินค้า", "ชื่อหมวดหมู่"}
+
+INTENT_TEMPLATES: List[Dict[str, Any]] = [
+    {
+        "name": "category_summary",
+        "required": [["แต่ละหมวด", "ทุกหมวด", "per category", "by category", "each category"]],
+        "slots": {"material", "stock_status", "price"},
+        "aggregates": {"count", "average", "sum"},
+        "covers": {"หมวดหมู่", "ราคา", "จำนวนสต็อก", "สถานะสต็อก"},
+        "sql": _category_summary_sql,
+    },
+    {
+        "name": "assembly_summary",
+        "required": [["ประกอบ", "assembly", "assemble"], ["กี่", "จำนวน", "how many", "count", "เทียบ", "vs"]],
+        # The template reports both groups, so naming the unassembled one is not a negation
+        "allows": ["ไม่ต้องประกอบ", "ไม่ประกอบ", "no assembly"],
+        "slots": {"category"},
+        "aggregates": {"count", "average"},
+        "covers": {"ต้องประกอบ", "ราคา", "จำนวนสต็อก"},
+        "sql": _assembly_summary_sql,
+    },
+    {
+        "name": "stock_status_summary",
+        "required": [["สถานะสต็อก", "stock status"], ["แต่ละสถานะ", "กี่", "จำนวน", "สัดส่วน", "เปอร์เซ็นต์", "breakdown", "how many"]],
+        "slots": {"category"},
+        "aggregates": {"count", "sum", "percent"},
+        "covers": {"สถานะสต็อก", "จำนวนสต็อก"},
+        "sql": _stock_status_summary_sql,
+    },
+    {
+        "name": "inventory_value",
+        "required": [["มูลค่าสต็อก", "มูลค่ารวม", "มูลค่าสินค้า", "inventory value", "stock value"]],
+        "slots": {"category", "material", "stock_status"},
+        "aggregates": {"count", "sum"},
+        "covers": {"ราคา", "จำนวนสต็อก", "สถานะสต็อก"},
+        "sql": _inventory_value_sql,
+    },
+    {
+        "name": "product_search",
+        "required": [["อะไรบ้าง", "ทั้งหมด", "รายการ", "คืออะไร", "list", "show", "which"]],
+        "slots": {"category", "material", "stock_status", "price"},
+        "min_slots": 1,
+        "aggregates": set(),
+        "covers": {"หมวดหมู่", "วัสดุ", "ราคา", "จำนวนสต็อก", "สถานะสต็อก"},
+        "sql": lambda slots: (
+            "SELECT รหัสสินค้า, ชื่อสินค้า, หมวดหมู่, วัสดุ, ราคา, จำนวนสต็อก, สถานะสต็อก\n"
+            f"FROM สินค้า{_where(slots)}\nORDER BY ราคา DESC;"
+        ),
+    },
+]
+
+intent_stats: Dict[str, Any] = {"hits": {t["name"]: 0 for t in INTENT_TEMPLATES}, "misses": 0}
+_intent_stats_lock = threading.Lock()
+
+def _referenced_columns(text: str) -> set:
+    referenced = set()
+    for table in introspect_schema():
+        if table["name"] in SUMMARY_TABLES:
+            continue  # derived columns; the base columns they aggregate are checked instead
+        for col in table["columns"]:
+            if any(t in text for t in _schema_terms(col["name"], col["values"])):
+                referenced.add(col["name"])
+    return referenced
+
+def _has_blocker(text: str, allowed: List[str]) -> bool:
+    for phrase in INTENT_SAFE_PHRASES + allowed:
+        text = text.replace(phrase, " ")
+    return INTENT_BLOCKER_RE.search(text) is not None
+
+def _template_confidence(template: Dict[str, Any], text: str, slots: Dict[str, Any], rest: str, referenced: set) -> float:
+    if not set(slots) <= template["slots"] or len(slots) < template.get("min_slots", 0):
+        return 0.0
+    if _has_blocker(text, template.get("allows", [])) or COMPARISON_RE.search(rest):
+        return 0.0
+    if any(AGGREGATE_TERMS[a].search(text) for a in AGGREGATE_TERMS.keys() - template["aggregates"]):
+        return 0.0
+    slot_columns = {"category": "หมวดหมู่", "material": "วัสดุ", "stock_status": "สถานะสต็อก", "price": "ราคา"}
+    covered = template["covers"] | _ALWAYS_COVERED | {slot_columns[s] for s in slots}
+    if referenced - covered or re.search(r"\d", rest) or any(t in text for t in PRODUCT_TYPE_TERMS):
+        return 0.0
+    groups = template["required"]
+    return sum(any(k in text for k in group) for group in groups) / len(groups)
+
+def route_intent(question: str) -> Optional[Tuple[str, str]]:
+    """
+    Return (template name, SQL) when a template answers the question with
+    confidence >= INTENT_MIN_CONFIDENCE, else None.
+    """
+    text = normalize_question(question)
+    slots, rest = extract_slots(text)
+    referenced = _referenced_columns(text)
+    best, best_score = None, 0.0
+    for template in INTENT_TEMPLATES:
+        score = _template_confidence(template, text, slots, rest, referenced)
+        if score > best_score:
+            best, best_score = template, score
+    with _intent_stats_lock:
+        if best is None or best_score < INTENT_MIN_CONFIDENCE:
+            intent_stats["misses"] += 1
+            return None
+        intent_stats["hits"][best["name"]] += 1
+    return best["name"], best["sql"](slots)
+
+def intent_router_stats() -> Dict[str, Any]:
+    with _intent_stats_lock:
+        hits = sum(intent_stats["hits"].values())
+        total = hits + intent_stats["misses"]
+        return {
+            "hits": dict(intent_stats["hits"]),
+            "misses": intent_stats["misses"],
+            "hit_rate": round(hits / total, 4) if total else 0.0,
+        }
 
 # =========================
 # Pydantic Schemas
@@ -190,11 +1414,47 @@ class Text2SQLRequest(BaseModel):
     assumptions: Optional[str] = Field(None, description="Optional clarifications/assumptions")
     # Optional: cap result size
     limit: Optional[int] = Field(200, ge=1, le=10000, description="Max rows to return")
+    explanation_mode: Literal["none", "inline", "deferred"] = Field(
+        "inline",
+        description="none: skip the explanation, inline: generate it before responding, "
+                    "deferred: respond immediately and fetch it from /text2sql/explanations/{explanation_id}",
+    )
+    timeout_ms: Optional[int] = Field(None, ge=1, description="SQL execution time budget (capped by SQL_TIMEOUT_MS)")
+    max_vm_steps: Optional[int] = Field(None, ge=1000, description="SQLite VM instruction budget (capped by SQL_MAX_VM_STEPS)")
+    format: Literal["rows", "columnar", "msgpack", "arrow"] = Field(
+        "rows",
+        description="rows: list of {column: value} objects, columnar: columns + one array per column, "
+                    "msgpack/arrow: compact binary body (column-oriented)",
+    )
 
 class Text2SQLResponse(BaseModel):
     sql_query: str
-    explanation: str
-    results: Dict[str, Any]      # {columns: [...], rows: [...], row_count: n}
+    explanation: Optional[str] = None
+    explanation_id: Optional[str] = None   # set when explanation_mode == "deferred"
+    results: Dict[str, Any]      # {columns: [...], rows: [...], row_count: n} or {columns, data, row_count}
+
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "100"))
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", "16"))
+
+class Text2SQLBatchRequest(BaseModel):
+    items: List[Text2SQLRequest] = Field(..., min_length=1, max_length=BATCH_MAX_ITEMS)
+    max_concurrency: Optional[int] = Field(
+        None, ge=1, description="Questions processed at once (capped by BATCH_MAX_CONCURRENCY)"
+    )
+
+class Text2SQLBatchItem(BaseModel):
+    index: int
+    response: Optional[Text2SQLResponse] = None
+    error: Optional[Dict[str, Any]] = None   # {status: int, detail: str}
+
+class Text2SQLBatchResponse(BaseModel):
+    items: List[Text2SQLBatchItem]
+    unique_questions: int
+
+class ExplanationJobResponse(BaseModel):
+    explanation_id: str
+    status: Literal["pending", "done"]
+    explanation: Optional[str] = None
 
 # =========================
 # Utilities
@@ -271,13 +1531,22 @@ def extract_sql_query(model_output: str) -> str:
     
     return result
 
+def sample_rows(results: Dict[str, Any], n: int) -> List[Dict[str, Any]]:
+    """
+    First n rows as dicts, whether results are row- or column-oriented.
+    """
+    if "data" in results:
+        head = [column[:n] for column in results["data"]]
+        return [dict(zip(results["columns"], values)) for values in zip(*head)]
+    return results.get("rows", [])[:n]
+
 def format_results_summary(results: Dict[str, Any]) -> str:
     """
     Create a concise summary of query results for explanation generation.
     """
     row_count = results.get("row_count", 0)
     columns = results.get("columns", [])
-    rows = results.get("rows", [])
+    rows = sample_rows(results, 3)
     
     if row_count == 0:
         return "No results found."
@@ -294,53 +1563,389 @@ def format_results_summary(results: Dict[str, Any]) -> str:
     
     return summary
 
-def maybe_wrap_with_limit(sql: str, limit: Optional[int]) -> str:
+def build_explanation_messages(question: str, sql_query: str, results: Dict[str, Any]) -> List[Dict[str, str]]:
+    results_summary = format_results_summary(results)
+
+    prompt = EXPLANATION_PROMPT.format(
+        question=question,
+        sql_query=sql_query,
+        results_summary=results_summary
+    )
+
+    return [
+        {"role": "system", "content": "You are a helpful data analyst."},
+        {"role": "user", "content": prompt}
+    ]
+
+def fallback_explanation(results: Dict[str, Any]) -> str:
+    row_count = results.get("row_count", 0)
+    return f"Query executed successfully. Found {row_count} result{'s' if row_count != 1 else ''}."
+
+async def stream_explanation(question: str, sql_query: str, results: Dict[str, Any]):
     """
-    Add LIMIT clause if not already present and limit is specified.
+    Yield explanation text deltas as the model produces them.
+    Falls back to the static explanation if the stream fails before any text.
     """
-    if not limit:
-        return sql
-    # Simple LIMIT appender if none present
-    low = sql.lower()
-    if " limit " in low:
-        return sql
-    return sql.rstrip().rstrip(";") + f" LIMIT {limit};"
+    sent_any = False
+    try:
+        messages = build_explanation_messages(question, sql_query, results)
+        async with model_slots:
+            stream = await model.achat_stream(messages=messages)
+            async for chunk in stream:
+                if chunk.get("usage"):
+                    record_model_usage("explanation", chunk)
+                if not chunk.get("choices"):
+                    continue
+                delta = chunk["choices"][0].get("delta", {}).get("content")
+                if delta:
+                    sent_any = True
+                    yield delta
+    except Exception:
+        if not sent_any:
+            yield fallback_explanation(results)
 
-def generate_explanation(question: str, sql_query: str, results: Dict[str, Any]) -> str:
+async def generate_explanation(question: str, sql_query: str, results: Dict[str, Any]) -> str:
     """
     Generate explanation using the AI model after query execution.
     """
     try:
-        results_summary = format_results_summary(results)
-        
-        prompt = EXPLANATION_PROMPT.format(
-            question=question,
-            sql_query=sql_query,
-            results_summary=results_summary
-        )
-        
-        messages = [
-            {"role": "system", "content": "You are a helpful data analyst."},
-            {"role": "user", "content": prompt}
-        ]
-        
-        out = model.chat(messages=messages)
+        messages = build_explanation_messages(question, sql_query, results)
+    except Exception:
+        return fallback_explanation(results)
+    return await explain(messages, fallback_explanation(results))
+
+async def explain(messages: List[Dict[str, str]], fallback: str) -> str:
+    """
+    Run prepared explanation messages through the model; `fallback` is returned if it fails.
+    """
+    try:
+        async with model_slots:
+            out = await model.achat(messages=messages)
+        record_model_usage("explanation", out)
         explanation = out["choices"][0]["message"]["content"].strip()
         
         return explanation
         
     except Exception as e:
         # Fallback explanation if AI generation fails
-        row_count = results.get("row_count", 0)
-        return f"Query executed successfully. Found {row_count} result{'s' if row_count != 1 else ''}."
+        return fallback
+
+# =========================
+# SQL Generation Cache
+# =========================
+SQL_CACHE_MAX_ENTRIES = int(os.getenv("SQL_CACHE_MAX_ENTRIES", "512"))
+SQL_CACHE_TTL_SECONDS = float(os.getenv("SQL_CACHE_TTL_SECONDS", "3600"))
+# 0 disables the near-duplicate tier; 0.85 is a reasonable starting point
+SQL_CACHE_SIMILARITY = float(os.getenv("SQL_CACHE_SIMILARITY", "0"))
+
+_THAI_SPACE_RE = re.compile(r"(?<=[\u0E00-\u0E7F]) | (?=[\u0E00-\u0E7F])")
+# Comparison operators change a question's meaning; they are spelled out as the
+# words people type instead (ราคา > 500 == ราคามากกว่า 500) rather than dropped
+_OPERATOR_WORDS = {
+    ">=": "มากกว่าหรือเท่ากับ", "≥": "มากกว่าหรือเท่ากับ",
+    "<=": "น้อยกว่าหรือเท่ากับ", "≤": "น้อยกว่าหรือเท่ากับ",
+    "!=": "ไม่เท่ากับ", "<>": "ไม่เท่ากับ", "≠": "ไม่เท่ากับ",
+    ">": "มากกว่า", "<": "น้อยกว่า", "=": "เท่ากับ",
+}
+_OPERATOR_RE = re.compile("|".join(re.escape(op) for op in sorted(_OPERATOR_WORDS, key=len, reverse=True)))
+
+def _fold_punctuation(text: str) -> str:
+    # Between digits, "," is a thousands separator (1,000 -> 1000) and "." a decimal point
+    chars = []
+    for i, ch in enumerate(text):
+        if unicodedata.category(ch)[0] == "P" or ch == "ฯ":
+            in_number = 0 < i < len(text) - 1 and text[i - 1].isdigit() and text[i + 1].isdigit()
+            if in_number and ch == ",":
+                continue
+            if not (in_number and ch == "."):
+                ch = " "
+        chars.append(ch)
+    return "".join(chars)
+
+def normalize_question(text: Optional[str]) -> str:
+    """
+    Fold case, whitespace and Thai/Latin punctuation so trivially different
+    phrasings of the same question share one cache key. Symbols are kept;
+    comparison operators are replaced by their Thai words.
+    """
+    if not text:
+        return ""
+    text = unicodedata.normalize("NFKC", text).casefold()
+    # NFKC splits Thai sara am (ำ) into nikhahit + sara aa; recompose it so
+    # literals such as "ต่ำกว่า" or "จำนวน" in the router still match
+    text = text.replace("\u0e4d\u0e32", "\u0e33")
+    text = _OPERATOR_RE.sub(lambda m: f" {_OPERATOR_WORDS[m.group()]} ", text)
+    text = _fold_punctuation(text)
+    text = " ".join(text.split())
+    # Thai is written without word spaces, so spacing next to Thai text is not significant
+    return _THAI_SPACE_RE.sub("", text)
+
+# Words that flip or bound a question's meaning while barely changing its trigrams
+_QUALIFIER_RE = re.compile(
+    "|".join(sorted(set(_OPERATOR_WORDS.values()), key=len, reverse=True))
+    + "|" + COMPARISON_RE.pattern + "|" + INTENT_BLOCKER_RE.pattern
+)
+
+def _qualifiers(text: str) -> Tuple[str, ...]:
+    """Numbers, comparisons, negations and rankings in order; near-duplicates must share them."""
+    return tuple(re.findall(r"\d+", text)) + tuple(_QUALIFIER_RE.findall(text))
+
+def _char_ngrams(text: str, n: int = 3) -> frozenset:
+    text = text.replace(" ", "")
+    if len(text) <= n:
+        return frozenset([text]) if text else frozenset()
+    return frozenset(text[i:i + n] for i in range(len(text) - n + 1))
+
+class SQLGenerationCache:
+    """
+    Thread-safe LRU + TTL cache of generated SQL keyed on the normalized
+    question and assumptions.
+
+    When similarity > 0, a miss on the exact key falls back to the most similar
+    cached question (character trigram Jaccard) with the same assumptions, the
+    same numbers and the same comparison / negation / ranking words: "มากกว่า 3 ปี"
+    never reuses the SQL of "มากกว่า 5 ปี", nor "ไม่ต้องประกอบ" that of "ต้องประกอบ".
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float, similarity: float = 0.0):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity = similarity
+        # key -> (stored_at, trigrams, qualifiers, sql)
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[float, frozenset, Tuple[str, ...], str]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.similar_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(question: str, assumptions: Optional[str]) -> Tuple[str, str]:
+        return normalize_question(question), normalize_question(assumptions)
+
+    def get(self, question: str, assumptions: Optional[str]) -> Optional[str]:
+        key = self.make_key(question, assumptions)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if now - entry[0] <= self.ttl_seconds:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[3]
+                del self._entries[key]
+
+            if self.similarity > 0:
+                match = self._most_similar(key, now)
+                if match is not None:
+                    self._entries.move_to_end(match)
+                    self.similar_hits += 1
+                    return self._entries[match][3]
+
+            self.misses += 1
+            return None
+
+    def _most_similar(self, key: Tuple[str, str], now: float) -> Optional[Tuple[str, str]]:
+        grams = _char_ngrams(key[0])
+        if not grams:
+            return None
+        qualifiers = _qualifiers(key[0])
+        best_key, best_score = None, self.similarity
+        for cached_key, (stored_at, cached_grams, cached_qualifiers, _) in self._entries.items():
+            if cached_key[1] != key[1] or cached_qualifiers != qualifiers or now - stored_at > self.ttl_seconds:
+                continue
+            union = len(grams | cached_grams)
+            score = len(grams & cached_grams) / union if union else 0.0
+            if score >= best_score:
+                best_key, best_score = cached_key, score
+        return best_key
+
+    def put(self, question: str, assumptions: Optional[str], sql_query: str) -> None:
+        if self.max_entries <= 0:
+            return
+        key = self.make_key(question, assumptions)
+        with self._lock:
+            self._entries[key] = (time.monotonic(), _char_ngrams(key[0]), _qualifiers(key[0]), sql_query)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "similar_hits": self.similar_hits,
+                "misses": self.misses,
+            }
+
+sql_cache = SQLGenerationCache(SQL_CACHE_MAX_ENTRIES, SQL_CACHE_TTL_SECONDS, SQL_CACHE_SIMILARITY)
+
+async def generate_sql(question: str, assumptions: Optional[str]) -> str:
+    """
+    Return a cleaned SQL query for the question. Questions matching an intent
+    template are answered locally; otherwise the model is called on a cache miss.
+    """
+    if INTENT_ROUTER and not assumptions:
+        with stage("intent_routing"):
+            routed = await run_in_db_executor(route_intent, question)
+        if routed is not None:
+            return routed[1]
+
+    cached = sql_cache.get(question, assumptions)
+    if cached is not None:
+        return cached
+
+    user_content = question
+    if assumptions:
+        user_content += f"\n\nAdditional assumptions/notes: {assumptions}"
+
+    with stage("prompt_build"):
+        system_prompt = await run_in_db_executor(build_sql_prompt, question)
+    messages = [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": user_content}
+    ]
+
+    with stage("sql_generation"):
+        async with model_slots:
+            sql_out = await model.achat(messages=messages)
+    record_prompt_usage(sql_out)
+    record_model_usage("sql_generation", sql_out)
+    sql_content = sql_out["choices"][0]["message"]["content"]
+
+    with stage("sql_extract"):
+        sql_query = extract_sql_query(sql_content)
+    sql_cache.put(question, assumptions, sql_query)
+    return sql_query
+
+# =========================
+# Deferred Explanations
+# =========================
+EXPLANATION_JOBS_MAX = int(os.getenv("EXPLANATION_JOBS_MAX", "1000"))
+# Finished explanations can be fetched for this long
+EXPLANATION_JOBS_TTL_SECONDS = float(os.getenv("EXPLANATION_JOBS_TTL_SECONDS", "600"))
+
+class ExplanationJobStore:
+    """
+    Bounded in-process store of background explanation jobs.
+    Only the prompt is kept, not the result rows. Finished jobs expire after
+    ttl_seconds; the oldest jobs are dropped (and cancelled if still running) once full.
+    Not thread-safe: use it only from the event loop (async endpoints).
+    """
+
+    def __init__(self, max_jobs: int, ttl_seconds: float):
+        self.max_jobs = max_jobs
+        self.ttl_seconds = ttl_seconds
+        self._jobs: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+
+    def submit(self, question: str, sql_query: str, results: Dict[str, Any]) -> str:
+        # Build the prompt now (it samples 3 rows) so the full results can be freed
+        try:
+            messages = build_explanation_messages(question, sql_query, results)
+        except Exception:
+            messages = None
+        fallback = fallback_explanation(results)
+
+        self._expire(time.monotonic())
+        job_id = uuid.uuid4().hex
+        job = {"status": "pending", "explanation": None, "finished_at": None}
+        job["task"] = asyncio.create_task(self._run(job, messages, fallback))
+        self._jobs[job_id] = job
+        while len(self._jobs) > self.max_jobs:
+            _, evicted = self._jobs.popitem(last=False)
+            evicted["task"].cancel()
+        return job_id
+
+    @staticmethod
+    async def _run(job: Dict[str, Any], messages: Optional[List[Dict[str, str]]], fallback: str) -> None:
+        job["explanation"] = await explain(messages, fallback) if messages else fallback
+        job["status"] = "done"
+        job["finished_at"] = time.monotonic()
+
+    def _expire(self, now: float) -> None:
+        expired = [
+            job_id for job_id, job in self._jobs.items()
+            if job["finished_at"] is not None and now - job["finished_at"] > self.ttl_seconds
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        self._expire(time.monotonic())
+        return self._jobs.get(job_id)
+
+explanation_jobs = ExplanationJobStore(EXPLANATION_JOBS_MAX, EXPLANATION_JOBS_TTL_SECONDS)
+
+# =========================
+# Binary Result Formats
+# =========================
+BINARY_MEDIA_TYPES = {
+    "msgpack": "application/x-msgpack",
+    "arrow": "application/vnd.apache.arrow.stream",
+}
+
+def row_format_for(fmt: str) -> str:
+    # Binary bodies are built straight from column arrays
+    return "rows" if fmt == "rows" else "columnar"
+
+def check_format_available(fmt: str) -> None:
+    if fmt == "msgpack" and msgpack is None:
+        raise HTTPException(status_code=400, detail="format 'msgpack' requires the msgpack package on the server.")
+    if fmt == "arrow" and pyarrow is None:
+        raise HTTPException(status_code=400, detail="format 'arrow' requires the pyarrow package on the server.")
+
+def _arrow_column(values: List[Any]):
+    try:
+        return pyarrow.array(values)
+    except (pyarrow.ArrowInvalid, pyarrow.ArrowTypeError):
+        # SQLite columns may mix types; fall back to text
+        return pyarrow.array([None if v is None else str(v) for v in values], type=pyarrow.string())
+
+def encode_binary_response(response: "Text2SQLResponse", fmt: str) -> Response:
+    """
+    msgpack: the Text2SQLResponse fields as a map, results in columnar form.
+    arrow:   an Arrow IPC stream of the result table; sql_query, explanation and
+             explanation_id travel in the schema metadata.
+    """
+    if fmt == "msgpack":
+        body = msgpack.packb(response.model_dump(), use_bin_type=True, default=str)
+    else:
+        results = response.results
+        table = pyarrow.Table.from_arrays(
+            [_arrow_column(column) for column in results["data"]],
+            names=results["columns"],
+        )
+        metadata = {
+            "sql_query": response.sql_query,
+            "explanation": response.explanation or "",
+            "explanation_id": response.explanation_id or "",
+        }
+        table = table.replace_schema_metadata(metadata)
+        sink = pyarrow.BufferOutputStream()
+        with pyarrow.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        body = sink.getvalue().to_pybytes()
+    return Response(content=body, media_type=BINARY_MEDIA_TYPES[fmt])
 
 # =========================
 # FastAPI App
 # =========================
+@asynccontextmanager
+async def lifespan(_: FastAPI):
+    # Introspect (and scan the enum columns) before serving, not on the first request
+    await run_with_connection(introspect_schema)
+    yield
+
 app = FastAPI(
     title="Text2SQL + Execute (School DB)",
     version="1.0.0",
-    description="Turns NL questions into SQL with watsonx.ai gpt-oss-120b and executes on SQLite school.db."
+    description="Turns NL questions into SQL with watsonx.ai gpt-oss-120b and executes on SQLite school.db.",
+    lifespan=lifespan,
 )
 
 app.add_middleware(
@@ -351,58 +1956,276 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+class ServerTimingMiddleware:
+    """
+    Collect stage() timings for each HTTP request and send them back as a
+    Server-Timing header. Plain ASGI so the endpoint runs in the same context.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        timings: Dict[str, float] = {}
+        token = request_timings.set(timings)
+        start = time.perf_counter()
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                timings["total"] = (time.perf_counter() - start) * 1000
+                value = ", ".join(f"{name};dur={ms:.2f}" for name, ms in timings.items())
+                message = {**message, "headers": [*message.get("headers", []), (b"server-timing", value.encode())]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            request_timings.reset(token)
+
+app.add_middleware(ServerTimingMiddleware)
+
 @app.get("/health")
 def health():
     # Basic DB check
     try:
-        db_conn.execute("SELECT 1;").fetchone()
+        with db_pool.connection() as conn:
+            conn.execute("SELECT 1;").fetchone()
         db_ok = True
     except Exception:
         db_ok = False
-    return {"status": "ok", "db_connected": db_ok, "db_path": os.path.abspath(DB_PATH)}
+    return {
+        "status": "ok",
+        "db_connected": db_ok,
+        "db_path": os.path.abspath(DB_PATH),
+        "sql_cache": sql_cache.stats(),
+        "result_cache": result_cache.stats(),
+        "db_pool": db_pool.stats(),
+        "sql_budget_exceeded": dict(budget_stats),
+        "sql_statements": statement_stats.stats(),
+        "sql_prompt": dict(prompt_stats),
+        "intent_router": intent_router_stats(),
+    }
 
-@app.post("/text2sql", response_model=Text2SQLResponse)
-def text2sql(req: Text2SQLRequest):
+async def answer_question(req: Text2SQLRequest) -> Text2SQLResponse:
     """
-    Generate SQL from NL question, execute it on school.db, and return results with AI-generated explanation.
+    Full text2sql pipeline for one request; failures are raised as HTTPException.
     """
     try:
-        # Step 1: Generate SQL query
-        user_content = req.question
-        if req.assumptions:
-            user_content += f"\n\nAdditional assumptions/notes: {req.assumptions}"
-            
-        messages = [
-            {"role": "system", "content": SQL_GENERATION_PROMPT},
-            {"role": "user", "content": user_content}
-        ]
-        
-        sql_out = model.chat(messages=messages)
-        sql_content = sql_out["choices"][0]["message"]["content"]
+        # Step 1 + 2: Generate (or reuse cached) SQL query and clean it
+        sql_query = await generate_sql(req.question, req.assumptions)
         
-        # Step 2: Extract and clean SQL query
-        sql_query = extract_sql_query(sql_content)
-        
-        # Step 3: Execute query
-        sql_to_run = maybe_wrap_with_limit(sql_query, req.limit)
-        results = run_select(sql_to_run)
+        # Step 3: Execute query (at most req.limit rows)
+        budget = QueryBudget.for_request(req.timeout_ms, req.max_vm_steps)
+        with stage("execute"):
+            results = await run_with_connection(run_select, sql_query, req.limit, row_format_for(req.format), budget)
+        result_rows.observe(results["row_count"])
         
         # Step 4: Generate explanation based on results
-        explanation = generate_explanation(req.question, sql_query, results)
+        explanation = explanation_id = None
+        if req.explanation_mode == "inline":
+            with stage("explanation"):
+                explanation = await generate_explanation(req.question, sql_query, results)
+        elif req.explanation_mode == "deferred":
+            explanation_id = explanation_jobs.submit(req.question, sql_query, results)
 
         return Text2SQLResponse(
             sql_query=sql_query,
             explanation=explanation,
+            explanation_id=explanation_id,
             results=results
         )
 
     except ValueError as ve:
+        errors_total.inc(error="sql_parse")
         raise HTTPException(status_code=400, detail=f"SQL parsing error: {ve}")
-    except HTTPException:
+    except HTTPException as he:
+        errors_total.inc(error=error_class(he.status_code, he.detail))
         raise
     except Exception as e:
+        errors_total.inc(error="internal")
         raise HTTPException(status_code=500, detail=f"Model/DB error: {e}")
 
+def _stats_metrics(prefix: str, stats: Dict[str, Any], kinds: Dict[str, str]) -> List[str]:
+    lines = []
+    for key, kind in kinds.items():
+        name = f"text2sql_{prefix}_{key}"
+        lines += [f"# TYPE {name} {kind}", f"{name} {stats[key]:g}"]
+    return lines
+
+@app.get("/metrics")
+def metrics():
+    """
+    Prometheus text exposition of latency histograms, token/row/error counters
+    and the cache, pool and budget statistics also shown on /health.
+    """
+    lines: List[str] = []
+    for metric in (stage_seconds, result_rows, model_tokens_total, errors_total):
+        lines += metric.render()
+    lines += _stats_metrics("sql_cache", sql_cache.stats(), {
+        "entries": "gauge", "hits": "counter", "similar_hits": "counter", "misses": "counter"})
+    lines += _stats_metrics("result_cache", result_cache.stats(), {
+        "entries": "gauge", "bytes": "gauge", "hits": "counter", "misses": "counter", "invalidations": "counter"})
+    lines += _stats_metrics("db_pool", db_pool.stats(), {
+        "open": "gauge", "idle": "gauge", "checkouts": "counter", "waits": "counter",
+        "timeouts": "counter", "wait_seconds_total": "counter"})
+    lines += _stats_metrics("sql_statements", statement_stats.stats(), {
+        "templates": "gauge", "reused": "counter", "new": "counter"})
+    lines += _stats_metrics("sql_prompt", prompt_stats, {
+        "requests": "counter", "pruned": "counter", "prompt_chars": "counter", "prompt_tokens_est": "counter"})
+    lines += ["# TYPE text2sql_sql_budget_exceeded_total counter"]
+    lines += [f'text2sql_sql_budget_exceeded_total{{limit="{k}"}} {v}' for k, v in budget_stats.items()]
+    router = intent_router_stats()
+    lines += ["# TYPE text2sql_intent_router_hits_total counter"]
+    lines += [f'text2sql_intent_router_hits_total{{template="{k}"}} {v}' for k, v in router["hits"].items()]
+    lines += ["# TYPE text2sql_intent_router_misses_total counter", f"text2sql_intent_router_misses_total {router['misses']}"]
+    return Response(content="\n".join(lines) + "\n", media_type="text/plain; version=0.0.4")
+
+@app.post("/text2sql", response_model=Text2SQLResponse)
+async def text2sql(req: Text2SQLRequest):
+    """
+    Generate SQL from NL question, execute it on school.db, and return results with AI-generated explanation.
+    """
+    check_format_available(req.format)
+    response = await answer_question(req)
+    with stage("serialize"):
+        if req.format in BINARY_MEDIA_TYPES:
+            return encode_binary_response(response, req.format)
+        return Response(content=response.model_dump_json(), media_type="application/json")
+
+@app.post("/text2sql/batch", response_model=Text2SQLBatchResponse)
+async def text2sql_batch(batch: Text2SQLBatchRequest):
+    """
+    Answer many questions in one call. Identical requests (ignoring case and
+    whitespace) are answered once; distinct ones run concurrently, at most
+    max_concurrency at a time. Each item carries either a response or an error.
+    """
+    if any(item.format in BINARY_MEDIA_TYPES for item in batch.items):
+        raise HTTPException(status_code=400, detail="Batch supports format 'rows' or 'columnar' only.")
+
+    slots = asyncio.Semaphore(min(batch.max_concurrency or BATCH_MAX_CONCURRENCY, BATCH_MAX_CONCURRENCY))
+
+    async def run_one(req: Text2SQLRequest) -> Tuple[Optional[Text2SQLResponse], Optional[Dict[str, Any]]]:
+        async with slots:
+            try:
+                return await answer_question(req), None
+            except HTTPException as he:
+                return None, {"status": he.status_code, "detail": he.detail}
+
+    def dedup_key(req: Text2SQLRequest) -> Tuple[Any, ...]:
+        # Not the SQL cache key: questions must match as typed, punctuation and symbols included
+        def fold(text: Optional[str]) -> str:
+            return " ".join((text or "").split()).casefold()
+        return (
+            fold(req.question), fold(req.assumptions),
+            req.limit, req.format, req.explanation_mode, req.timeout_ms, req.max_vm_steps,
+        )
+
+    tasks: Dict[Tuple[Any, ...], "asyncio.Task"] = {}
+    for req in batch.items:
+        key = dedup_key(req)
+        if key not in tasks:
+            tasks[key] = asyncio.ensure_future(run_one(req))
+    await asyncio.gather(*tasks.values())
+
+    items = []
+    for index, req in enumerate(batch.items):
+        response, error = tasks[dedup_key(req)].result()
+        items.append(Text2SQLBatchItem(index=index, response=response, error=error))
+    with stage("serialize"):
+        body = Text2SQLBatchResponse(items=items, unique_questions=len(tasks)).model_dump_json()
+        return Response(content=body, media_type="application/json")
+
+@app.get("/text2sql/explanations/{explanation_id}", response_model=ExplanationJobResponse)
+async def get_explanation(explanation_id: str):
+    """
+    Poll a deferred explanation created with explanation_mode="deferred".
+    Async so the job store is only touched on the event loop, never from a worker thread.
+    """
+    job = explanation_jobs.get(explanation_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired explanation_id.")
+    return ExplanationJobResponse(
+        explanation_id=explanation_id,
+        status=job["status"],
+        explanation=job["explanation"],
+    )
+
+STREAM_ROW_CHUNK_SIZE = int(os.getenv("STREAM_ROW_CHUNK_SIZE", "100"))
+
+def _ndjson(event: Dict[str, Any]) -> bytes:
+    return (json.dumps(event, ensure_ascii=False, default=str) + "\n").encode("utf-8")
+
+@app.post("/text2sql/stream")
+async def text2sql_stream(req: Text2SQLRequest):
+    """
+    Streaming variant of /text2sql (NDJSON, one event per line):
+      {"type": "sql", "sql_query": ...}
+      {"type": "columns", "columns": [...]}
+      {"type": "rows", "rows": [...]}              (repeated, STREAM_ROW_CHUNK_SIZE rows each)
+      {"type": "row_count", "row_count": n}
+      {"type": "explanation", "delta": "..."}      (repeated, as tokens arrive)
+      {"type": "explanation_job", "explanation_id": ...}   (instead, when explanation_mode == "deferred")
+      {"type": "done"}
+    Errors after the stream has started are sent as {"type": "error", "status": ..., "detail": ...}.
+    With format="columnar", row events carry {"data": [[...], ...]} (one array per column) instead of "rows".
+    """
+    if req.format not in ("rows", "columnar"):
+        raise HTTPException(status_code=400, detail="Streaming supports format 'rows' or 'columnar' only.")
+    try:
+        sql_query = await generate_sql(req.question, req.assumptions)
+    except ValueError as ve:
+        errors_total.inc(error="sql_parse")
+        raise HTTPException(status_code=400, detail=f"SQL parsing error: {ve}")
+    except Exception as e:
+        errors_total.inc(error="internal")
+        raise HTTPException(status_code=500, detail=f"Model/DB error: {e}")
+
+    async def events():
+        yield _ndjson({"type": "sql", "sql_query": sql_query})
+
+        # Rows go out chunk by chunk as SQLite produces them; only a small
+        # sample is kept back for the explanation prompt.
+        results: Dict[str, Any] = {"columns": [], "rows": [], "row_count": 0}
+        try:
+            started = time.perf_counter()
+            budget = QueryBudget.for_request(req.timeout_ms, req.max_vm_steps)
+            chunks = aiter_select(sql_query, STREAM_ROW_CHUNK_SIZE, req.limit, req.format, budget)
+            results["columns"] = await anext(chunks)
+            yield _ndjson({"type": "columns", "columns": results["columns"]})
+            async for chunk in chunks:
+                if len(results["rows"]) < 3:
+                    results["rows"].extend(sample_rows(chunk, 3 - len(results["rows"])))
+                results["row_count"] += chunk["row_count"]
+                payload = {"data": chunk["data"]} if "data" in chunk else {"rows": chunk["rows"]}
+                yield _ndjson({"type": "rows", **payload})
+        except HTTPException as he:
+            errors_total.inc(error=error_class(he.status_code, he.detail))
+            yield _ndjson({"type": "error", "status": he.status_code, "detail": he.detail})
+            return
+        except Exception as e:
+            errors_total.inc(error="internal")
+            yield _ndjson({"type": "error", "status": 500, "detail": f"Model/DB error: {e}"})
+            return
+        # Includes time spent waiting on the client to read each chunk
+        stage_seconds.observe(time.perf_counter() - started, stage="execute_stream")
+        result_rows.observe(results["row_count"])
+        yield _ndjson({"type": "row_count", "row_count": results["row_count"]})
+
+        if req.explanation_mode == "inline":
+            started = time.perf_counter()
+            async for delta in stream_explanation(req.question, sql_query, results):
+                yield _ndjson({"type": "explanation", "delta": delta})
+            stage_seconds.observe(time.perf_counter() - started, stage="explanation_stream")
+        elif req.explanation_mode == "deferred":
+            explanation_id = explanation_jobs.submit(req.question, sql_query, results)
+            yield _ndjson({"type": "explanation_job", "explanation_id": explanation_id})
+        yield _ndjson({"type": "done"})
+
+    return StreamingResponse(events(), media_type="application/x-ndjson")
+
 # Local dev
 if __name__ == "__main__":
     import uvicorn
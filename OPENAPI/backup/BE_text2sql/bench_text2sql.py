@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+"""
+Offline load test for app.py.
+
+ModelInference is replaced by a local fake with configurable latency and
+canned SQL, so no watsonx credentials or network are needed. The app runs
+in-process (httpx ASGITransport) against a synthetic furniture.db, and each
+concurrency level reports req/s plus p50/p95/p99 of the client latency and of
+every stage in the Server-Timing header.
+
+    python bench_text2sql.py --rows 100000 --concurrency 1,8,32,128 --requests 500
+    python bench_text2sql.py --model-latency-ms 800 --no-sql-cache --json out.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+HERE = Path(__file__).resolve().parent
+
+# ---------- คำถามทดสอบ (README) และ SQL ที่โมเดลจำลองตอบ ----------
+CANNED_SQL = {
+    "สินค้าในแต่ละหมวดหมู่มีกี่ชิ้น":
+        "SELECT หมวดหมู่, COUNT(*) AS จำนวนสินค้า FROM สินค้า GROUP BY หมวดหมู่ ORDER BY จำนวนสินค้า DESC;",
+    "สินค้าที่ราคาสูงกว่า 1000 บาทมีอะไรบ้าง":
+        "SELECT ชื่อสินค้า, ราคา FROM สินค้า WHERE ราคา > 1000 ORDER BY ราคา DESC;",
+    "สินค้าที่ต้องประกอบและไม่ต้องประกอบมีกี่ชิ้น":
+        "SELECT ต้องประกอบ, COUNT(*) AS จำนวน FROM สินค้า GROUP BY ต้องประกอบ;",
+    "สินค้าในหมวดห้องนั่งเล่นทั้งหมด":
+        "SELECT ชื่อสินค้า, ราคา, สี FROM สินค้า WHERE หมวดหมู่ = 'ห้องนั่งเล่น';",
+    "วัสดุที่ใช้ทำเฟอร์นิเจอร์มีอะไรบ้างและใช้กี่ชิ้น":
+        "SELECT วัสดุ, COUNT(*) AS จำนวน FROM สินค้า GROUP BY วัสดุ ORDER BY จำนวน DESC;",
+    "สินค้าที่มีสถานะสต็อกน้อยคืออะไร":
+        "SELECT ชื่อสินค้า, จำนวนสต็อก FROM สินค้า WHERE สถานะสต็อก = 'สต็อกน้อย';",
+    "ราคาเฉลี่ยของสินค้าในแต่ละหมวดหมู่":
+        "SELECT หมวดหมู่, ROUND(AVG(ราคา), 2) AS ราคาเฉลี่ย FROM สินค้า GROUP BY หมวดหมู่;",
+    "สินค้าที่มีการรับประกันมากกว่า 3 ปี":
+        "SELECT ชื่อสินค้า, การรับประกัน_ปี FROM สินค้า WHERE การรับประกัน_ปี > 3;",
+    "สินค้าที่น้ำหนักมากกว่า 100 ปอนด์":
+        "SELECT ชื่อสินค้า, น้ำหนัก_ปอนด์ FROM สินค้า WHERE น้ำหนัก_ปอนด์ > 100 ORDER BY น้ำหนัก_ปอนด์ DESC;",
+    "มูลค่าสต็อกรวมของสินค้าทั้งหมด":
+        "SELECT ROUND(SUM(ราคา * จำนวนสต็อก), 2) AS มูลค่าสต็อกรวม FROM สินค้า;",
+}
+DEFAULT_SQL = "SELECT ชื่อสินค้า, ราคา FROM สินค้า ORDER BY ราคา DESC LIMIT 10;"
+CANNED_EXPLANATION = "ผลลัพธ์แสดงข้อมูลสินค้าตามคำถาม โดยสรุปจากตารางสินค้าในฐานข้อมูลเฟอร์นิเจอร์"
+
+# ---------- โมเดลจำลอง ----------
+class FakeModelInference:
+    """Stand-in for ModelInference: sleeps for a jittered latency, then answers from CANNED_SQL."""
+
+    latency_s = 0.5
+    jitter = 0.2
+    rng = random.Random(0)
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    @classmethod
+    def _delay(cls) -> float:
+        return max(0.0, cls.latency_s * (1 + cls.rng.uniform(-cls.jitter, cls.jitter)))
+
+    @staticmethod
+    def _reply(messages: List[Dict[str, str]]) -> Dict[str, Any]:
+        if "SQL expert" in messages[0]["content"]:
+            question = messages[-1]["content"].split("\n")[0]
+            content = f"```sql\n{CANNED_SQL.get(question, DEFAULT_SQL)}\n```"
+        else:
+            content = CANNED_EXPLANATION
+        prompt_tokens = sum(len(m["content"].encode("utf-8")) for m in messages) // 4
+        return {
+            "choices": [{"message": {"role": "assistant", "content": content}}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": len(content.encode("utf-8")) // 4},
+        }
+
+    def chat(self, messages, **kwargs):
+        time.sleep(self._delay())
+        return self._reply(messages)
+
+    async def achat(self, messages, **kwargs):
+        await asyncio.sleep(self._delay())
+        return self._reply(messages)
+
+    async def achat_stream(self, messages, **kwargs):
+        reply = self._reply(messages)
+        words = reply["choices"][0]["message"]["content"].split(" ")
+        delay = self._delay() / max(1, len(words))
+
+        async def chunks():
+            for word in words:
+                await asyncio.sleep(delay)
+                yield {"choices": [{"delta": {"content": word + " "}}]}
+            yield {"choices": [], "usage": reply["usage"]}
+        return chunks()
+
+# ---------- ฐานข้อมูลสังเคราะห์ ----------
+def build_synthetic_db(path: Path, rows: int, seed: int) -> None:
+    """Generate `rows` products with build_furniture_db.py's bulk loader."""
+    sys.path.insert(0, str(HERE))
+    import build_furniture_db
+
+    build_furniture_db.build_generated_db(path, rows, seed)
+
+# ---------- การวัดผล ----------
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered) + 0.5) - 1))
+    return ordered[index]
+
+def parse_server_timing(header: str) -> Dict[str, float]:
+    timings = {}
+    for part in filter(None, (p.strip() for p in header.split(","))):
+        name, _, params = part.partition(";")
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "dur":
+                timings[name] = float(value)
+    return timings
+
+async def run_level(app_module, concurrency: int, total: int, questions: List[str], body: Dict[str, Any]) -> Dict[str, Any]:
+    import httpx
+
+    latencies: List[float] = []
+    stages: Dict[str, List[float]] = {}
+    errors: Dict[int, int] = {}
+    next_index = 0
+
+    transport = httpx.ASGITransport(app=app_module.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        async def worker():
+            nonlocal next_index
+            while next_index < total:
+                i = next_index
+                next_index += 1
+                payload = {**body, "question": questions[i % len(questions)]}
+                start = time.perf_counter()
+                response = await client.post("/text2sql", json=payload)
+                latencies.append((time.perf_counter() - start) * 1000)
+                if response.status_code != 200:
+                    errors[response.status_code] = errors.get(response.status_code, 0) + 1
+                for name, ms in parse_server_timing(response.headers.get("server-timing", "")).items():
+                    stages.setdefault(name, []).append(ms)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    summary = lambda values: {
+        "n": len(values),
+        "p50_ms": round(percentile(values, 50), 3),
+        "p95_ms": round(percentile(values, 95), 3),
+        "p99_ms": round(percentile(values, 99), 3),
+    }
+    return {
+        "concurrency": concurrency,
+        "requests": total,
+        "elapsed_s": round(elapsed, 3),
+        "req_per_s": round(total / elapsed, 2),
+        "errors": errors,
+        "latency": summary(latencies),
+        "stages": {name: summary(values) for name, values in stages.items()},
+    }
+
+def print_level(result: Dict[str, Any]) -> None:
+    print(f"\nconcurrency={result['concurrency']}  requests={result['requests']}  "
+          f"{result['req_per_s']} req/s  errors={result['errors'] or 0}")
+    print(f"  {'stage':<20}{'n':>7}{'p50 ms':>11}{'p95 ms':>11}{'p99 ms':>11}")
+    for name, s in [("client", result["latency"]), *result["stages"].items()]:
+        print(f"  {name:<20}{s['n']:>7}{s['p50_ms']:>11.2f}{s['p95_ms']:>11.2f}{s['p99_ms']:>11.2f}")
+
+# ---------- main ----------
+def parse_args():
+    parser = argparse.ArgumentParser(description="Offline text2sql benchmark with a stand-in model.")
+    parser.add_argument("--rows", type=int, default=100_000, help="rows in the synthetic สินค้า table")
+    parser.add_argument("--db", type=Path, help="existing database to use instead of building one")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--concurrency", default="1,8,32,128", help="comma-separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=500, help="requests per concurrency level")
+    parser.add_argument("--warmup", type=int, default=20, help="requests before measuring (not reported)")
+    parser.add_argument("--model-latency-ms", type=float, default=500)
+    parser.add_argument("--model-jitter", type=float, default=0.2, help="relative +/- jitter on model latency")
+    parser.add_argument("--explanation-mode", choices=["none", "inline", "deferred"], default="inline")
+    parser.add_argument("--format", choices=["rows", "columnar", "msgpack", "arrow"], default="rows")
+    parser.add_argument("--limit", type=int, default=200)
+    parser.add_argument("--no-sql-cache", action="store_true", help="call the model for every question")
+    parser.add_argument("--no-result-cache", action="store_true", help="run every query on SQLite")
+    parser.add_argument("--no-intent-router", action="store_true")
+    parser.add_argument("--json", type=Path, help="also write results to this file")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+
+    FakeModelInference.latency_s = args.model_latency_ms / 1000
+    FakeModelInference.jitter = args.model_jitter
+    FakeModelInference.rng = random.Random(args.seed)
+
+    db_path = args.db
+    if db_path is None:
+        db_path = Path(tempfile.gettempdir()) / f"bench_furniture_{args.rows}_{args.seed}.db"
+        if not db_path.exists():
+            print(f"building {db_path} ({args.rows:,} rows)...")
+            started = time.perf_counter()
+            build_synthetic_db(db_path, args.rows, args.seed)
+            print(f"built in {time.perf_counter() - started:.1f}s")
+
+    # app.py reads its configuration at import time
+    os.environ.setdefault("WATSONX_API_KEY", "offline-benchmark")
+    os.environ.setdefault("WATSONX_PROJECT_ID", "offline-benchmark")
+    os.environ["FURNITURE_DB_PATH"] = str(db_path)
+    if args.no_sql_cache:
+        os.environ["SQL_CACHE_MAX_ENTRIES"] = "0"
+    if args.no_result_cache:
+        os.environ["RESULT_CACHE_MAX_BYTES"] = "0"
+    if args.no_intent_router:
+        os.environ["INTENT_ROUTER"] = "0"
+
+    import ibm_watsonx_ai.foundation_models
+    ibm_watsonx_ai.foundation_models.ModelInference = FakeModelInference
+    sys.path.insert(0, str(HERE))
+    import app as app_module
+
+    questions = list(CANNED_SQL)
+    random.Random(args.seed).shuffle(questions)
+    body = {"limit": args.limit, "explanation_mode": args.explanation_mode, "format": args.format}
+    levels = [int(c) for c in args.concurrency.split(",") if c.strip()]
+
+    async def run_all():
+        if args.warmup:
+            await run_level(app_module, min(8, args.warmup), args.warmup, questions, body)
+        return [await run_level(app_module, c, args.requests, questions, body) for c in levels]
+
+    results = asyncio.run(run_all())
+    print(f"\nmodel latency {args.model_latency_ms:g} ms (+/-{args.model_jitter:.0%}), "
+          f"db {db_path}, explanation_mode={args.explanation_mode}, format={args.format}")
+    for result in results:
+        print_level(result)
+
+    if args.json:
+        report = {"args": {k: str(v) if isinstance(v, Path) else v for k, v in vars(args).items()}, "levels": results}
+        args.json.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+
+if __name__ == "__main__":
+    main()
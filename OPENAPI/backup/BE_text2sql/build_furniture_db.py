@@ -1,6 +1,13 @@
 #!/usr/bin/env python3
+import argparse
+import csv
+import hashlib
+import json
+import random
 import sqlite3
+import time
 from pathlib import Path
+from typing import Iterator
 import pandas as pd
 from datetime import datetime
 
@@ -255,9 +262,134 @@ def create_furniture_data():
     
     return pd.DataFrame(furniture_products)
 
+# ---------- ข้อมูลสังเคราะห์ (โหมด --rows) ----------
+# ประเภทสินค้า: (ชื่อ, หมวดหมู่, ช่วงยาว/กว้าง/สูง (นิ้ว), ราคากลาง, ช่วงน้ำหนัก (ปอนด์), โอกาสต้องประกอบ, วัสดุหลัก)
+PRODUCT_TYPES = [
+    ("โซฟา", "ห้องนั่งเล่น", (70, 110), (32, 75), (30, 38), 1200, (80, 180), 0.2,
+     ["ผ้ากำมะหยี่", "ผ้าลินิน", "หนังแท้", "หนังเทียม"]),
+    ("เก้าอี้อาร์มแชร์", "ห้องนั่งเล่น", (28, 40), (28, 38), (30, 42), 650, (30, 70), 0.3,
+     ["หนังแท้", "ผ้าลินิน", "ผ้ากำมะหยี่", "หวายเทียม"]),
+    ("โต๊ะกาแฟ", "ห้องนั่งเล่น", (36, 54), (18, 30), (15, 20), 350, (20, 60), 0.7,
+     ["กระจกเทมเปอร์", "ไม้วอลนัท", "ไม้โอ๊คแท้", "หินอ่อน"]),
+    ("ชั้นวางทีวี", "ห้องนั่งเล่น", (48, 80), (14, 20), (18, 26), 420, (40, 90), 0.9,
+     ["ไม้วอลนัท", "ไม้วิศวกรรม", "MDF เคลือบเงาสูง"]),
+    ("เก้าอี้ยาว", "ห้องนั่งเล่น", (36, 60), (14, 18), (16, 20), 180, (15, 35), 0.4,
+     ["หนังเทียม", "ไม้สนแท้", "ผ้าลินิน"]),
+    ("เตียง", "ห้องนอน", (75, 85), (38, 80), (35, 55), 750, (90, 200), 0.9,
+     ["ไม้วิศวกรรม", "ไม้โอ๊คแท้", "ไม้ยางพารา", "โครงเหล็ก"]),
+    ("ตู้เสื้อผ้า", "ห้องนอน", (36, 80), (20, 26), (70, 84), 900, (100, 250), 0.95,
+     ["ไม้วิศวกรรม", "MDF เคลือบเงาสูง", "ไม้สนแท้"]),
+    ("ตู้ข้างเตียง", "ห้องนอน", (18, 26), (15, 18), (22, 28), 180, (15, 40), 0.6,
+     ["ไม้สนแท้", "ไม้โอ๊คแท้", "ไม้ยางพารา"]),
+    ("ตู้ลิ้นชัก", "ห้องนอน", (30, 60), (16, 20), (30, 50), 520, (50, 120), 0.8,
+     ["ไม้วอลนัท", "ไม้สนแท้", "ไม้วิศวกรรม"]),
+    ("โต๊ะทานอาหาร", "ห้องทานอาหาร", (36, 96), (30, 42), (29, 31), 900, (50, 160), 0.8,
+     ["ไม้โอ๊คแท้", "หินอ่อน", "กระจกเทมเปอร์", "ไม้สนเก่า"]),
+    ("เก้าอี้ทานอาหาร", "ห้องทานอาหาร", (17, 22), (18, 24), (32, 40), 150, (8, 20), 0.5,
+     ["ไม้ยางพารา", "หนังเทียม", "โครงเหล็ก", "หวายเทียม"]),
+    ("ตู้โชว์", "ห้องทานอาหาร", (36, 72), (14, 18), (60, 80), 800, (80, 180), 0.85,
+     ["ไม้โอ๊คแท้", "กระจกเทมเปอร์", "ไม้วอลนัท"]),
+    ("โต๊ะทำงาน", "สำนักงาน", (40, 72), (20, 32), (29, 31), 450, (40, 110), 0.9,
+     ["ไม้วอลนัท", "ไม้วิศวกรรม", "ไผ่", "โครงเหล็ก"]),
+    ("เก้าอี้สำนักงาน", "สำนักงาน", (24, 28), (24, 28), (38, 48), 380, (30, 55), 0.9,
+     ["พนักพิงตาข่าย", "หนังแท้", "หนังเทียม"]),
+    ("ตู้เอกสาร", "สำนักงาน", (15, 36), (18, 25), (28, 52), 320, (40, 120), 0.5,
+     ["โครงเหล็ก", "ไม้วิศวกรรม"]),
+    ("ชั้นหนังสือ", "จัดเก็บ", (24, 48), (10, 16), (36, 84), 300, (25, 90), 0.95,
+     ["ไม้สนรีไซเคิล", "โครงเหล็ก", "ไม้วิศวกรรม", "ไผ่"]),
+    ("ตู้เก็บของ", "จัดเก็บ", (24, 48), (14, 20), (30, 72), 380, (40, 110), 0.9,
+     ["ไม้สนแท้", "MDF เคลือบเงาสูง", "โครงเหล็ก"]),
+    ("ชั้นวางของ", "จัดเก็บ", (24, 60), (12, 18), (30, 72), 160, (15, 50), 0.95,
+     ["โครงเหล็ก", "ไม้ยางพารา", "ไผ่"]),
+]
+# ตัวคูณราคาตามวัสดุหลัก
+MATERIAL_PRICE_FACTOR = {
+    "หนังแท้": 1.6, "หินอ่อน": 1.5, "ไม้วอลนัท": 1.4, "ไม้โอ๊คแท้": 1.35, "ผ้ากำมะหยี่": 1.2,
+    "ไม้สนเก่า": 1.1, "กระจกเทมเปอร์": 1.0, "ผ้าลินิน": 1.0, "หวายเทียม": 0.9, "ไม้สนแท้": 0.9,
+    "ไม้ยางพารา": 0.85, "ไผ่": 0.85, "ไม้สนรีไซเคิล": 0.8, "โครงเหล็ก": 0.8, "พนักพิงตาข่าย": 0.8,
+    "หนังเทียม": 0.75, "ไม้วิศวกรรม": 0.7, "MDF เคลือบเงาสูง": 0.65,
+}
+SECONDARY_MATERIALS = ["โครงไม้", "โครงเหล็ก", "ขาไม้โอ๊ค", "ขาโครเมี่ยม", "ฐานเหล็กหล่อ", "ฮาร์ดแวร์ทองเหลือง"]
+STYLES = ["", "", "สมัยใหม่", "สไตล์มินิมอล", "สไตล์สแกนดิเนเวียน", "สไตล์ลอฟท์", "สไตล์วินเทจ",
+          "สไตล์ญี่ปุ่น", "สไตล์คลาสสิก", "หรู", "ขนาดกะทัดรัด"]
+COLORS = ["ขาว", "ดำ", "เทาอ่อน", "เทาถ่าน", "น้ำตาลเข้ม", "โอ๊คธรรมชาติ", "วอลนัท", "ครีม", "เขียวมรกต",
+          "น้ำเงินกรมท่า", "ไผ่ธรรมชาติ/ดำ", "ดำ/เทา", "หินอ่อนขาว/ฐานดำ"]
+WARRANTY_YEARS = [1, 2, 3, 5, 10]
+WARRANTY_WEIGHTS = [30, 25, 25, 15, 5]
+WARRANTY_CUM_WEIGHTS = [sum(WARRANTY_WEIGHTS[:i + 1]) for i in range(len(WARRANTY_WEIGHTS))]
+LOW_STOCK_THRESHOLD = 5
+
+PRODUCT_COLUMNS = ["รหัสสินค้า", "ชื่อสินค้า", "หมวดหมู่", "วัสดุ", "ความยาว_นิ้ว", "ความกว้าง_นิ้ว", "ความสูง_นิ้ว",
+                   "สี", "ราคา", "น้ำหนัก_ปอนด์", "ต้องประกอบ", "การรับประกัน_ปี", "จำนวนสต็อก", "สถานะสต็อก"]
+
+def generate_products(rng: random.Random, start: int, count: int, id_width: int) -> Iterator[tuple]:
+    """สร้างแถวสินค้าสังเคราะห์ทีละแถว (tuple ตามลำดับ PRODUCT_COLUMNS) โดยไม่เก็บทั้งหมดไว้ในหน่วยความจำ"""
+    randint, random_, choice, lognorm = rng.randint, rng.random, rng.choice, rng.lognormvariate
+    for i in range(count):
+        name, category, length, width, height, median_price, weight, assembly, materials = choice(PRODUCT_TYPES)
+        material = choice(materials)
+        full_material = f"{material}, {choice(SECONDARY_MATERIALS)}" if random_() < 0.4 else material
+        price = median_price * MATERIAL_PRICE_FACTOR[material] * lognorm(0.0, 0.35)
+        stock = min(int(rng.expovariate(1 / 15)), 500)
+        yield (
+            f"FUR-{start + i + 1:0{id_width}d}",
+            f"{name}{material.split()[0]}{choice(STYLES)}",
+            category,
+            full_material,
+            randint(*length),
+            randint(*width),
+            randint(*height),
+            choice(COLORS),
+            max(19, round(price)) - 0.01,
+            round(weight[0] + (weight[1] - weight[0]) * random_(), 1),
+            random_() < assembly,
+            # สุ่มทีละแถว ข้อมูลจึงขึ้นกับ seed และจำนวนแถวเท่านั้น ไม่ขึ้นกับ chunk_size
+            rng.choices(WARRANTY_YEARS, cum_weights=WARRANTY_CUM_WEIGHTS)[0],
+            stock,
+            "สต็อกน้อย" if stock < LOW_STOCK_THRESHOLD else "มีสินค้า",
+        )
+
+def bulk_load_products(conn: sqlite3.Connection, rows: int, seed: int, chunk_size: int = 200_000):
+    """โหลดสินค้าสังเคราะห์ `rows` แถวด้วย executemany ทีละ chunk (หนึ่ง transaction ต่อ chunk)"""
+    rng = random.Random(seed)
+    id_width = max(3, len(str(rows)))
+    insert = f"INSERT INTO สินค้า ({', '.join(PRODUCT_COLUMNS)}) VALUES ({', '.join('?' * len(PRODUCT_COLUMNS))})"
+    started = time.perf_counter()
+    for start in range(0, rows, chunk_size):
+        count = min(chunk_size, rows - start)
+        with conn:
+            conn.executemany(insert, generate_products(rng, start, count, id_width))
+        done = start + count
+        print(f"   {done:,}/{rows:,} แถว ({done / (time.perf_counter() - started):,.0f} แถว/วินาที)")
+
+def build_generated_db(db_path: Path, rows: int, seed: int, chunk_size: int = 200_000):
+    """สร้างฐานข้อมูลสังเคราะห์ขนาด `rows` แถว: ปิด journal/sync ระหว่างโหลด แล้วจึงสร้าง index"""
+    if db_path.exists():
+        db_path.unlink()
+    conn = sqlite3.connect(db_path)
+    try:
+        # ไฟล์ถูกสร้างใหม่ทั้งหมด ถ้าโหลดไม่สำเร็จก็แค่รันใหม่ จึงไม่ต้องมี journal
+        conn.execute("PRAGMA journal_mode = OFF;")
+        conn.execute("PRAGMA synchronous = OFF;")
+        conn.execute("PRAGMA locking_mode = EXCLUSIVE;")
+        conn.execute("PRAGMA temp_store = MEMORY;")
+        conn.execute("PRAGMA cache_size = -262144;")  # 256 MB สำหรับการเรียงข้อมูลตอนสร้าง index
+
+        create_schema(conn, with_indexes=False)
+        populate_categories(conn)
+        bulk_load_products(conn, rows, seed, chunk_size)
+
+        started = time.perf_counter()
+        create_indexes(conn)
+        conn.execute("ANALYZE;")
+        conn.commit()
+        print(f"สร้าง index เรียบร้อย ({time.perf_counter() - started:.1f} วินาที)")
+    finally:
+        conn.close()
+
 # ---------- สร้างโครงสร้างฐานข้อมูล ----------
-def create_schema(conn: sqlite3.Connection):
-    """สร้างโครงสร้างฐานข้อมูลเฟอร์นิเจอร์"""
+def create_schema(conn: sqlite3.Connection, with_indexes: bool = True):
+    """สร้างโครงสร้างฐานข้อมูลเฟอร์นิเจอร์ (with_indexes=False สำหรับโหลดข้อมูลจำนวนมากก่อนสร้าง index)"""
     cur = conn.cursor()
 
     cur.execute("""
@@ -290,12 +422,59 @@ def create_schema(conn: sqlite3.Connection):
     );
     """)
 
-    # สร้าง index เพื่อประสิทธิภาพในการค้นหา
+    conn.commit()
+    if with_indexes:
+        create_indexes(conn)
+
+def create_indexes(conn: sqlite3.Connection):
+    """สร้าง index เพื่อประสิทธิภาพในการค้นหา รวมถึงตาราง FTS และตารางสรุปที่ดูแลด้วย trigger"""
+    cur = conn.cursor()
     cur.execute("CREATE INDEX IF NOT EXISTS idx_สินค้า_หมวดหมู่ ON สินค้า(หมวดหมู่);")
     cur.execute("CREATE INDEX IF NOT EXISTS idx_สินค้า_ราคา ON สินค้า(ราคา);")
     cur.execute("CREATE INDEX IF NOT EXISTS idx_สินค้า_สถานะสต็อก ON สินค้า(สถานะสต็อก);")
     cur.execute("CREATE INDEX IF NOT EXISTS idx_สินค้า_การรับประกัน ON สินค้า(การรับประกัน_ปี);")
-    
+    conn.commit()
+    create_search_index(conn)
+    create_summary_tables(conn)
+
+# คอลัมน์ที่ค้นหาด้วยข้อความบางส่วน (LIKE '%...%') ซึ่ง index ปกติช่วยไม่ได้
+SEARCH_COLUMNS = ["ชื่อสินค้า", "วัสดุ", "สี"]
+
+def create_search_index(conn: sqlite3.Connection):
+    """
+    สร้างตาราง FTS5 สินค้า_fts (tokenizer แบบ trigram ใช้ได้กับภาษาไทยที่ไม่มีการเว้นวรรคคำ)
+    แบบ external content อ้างอิง rowid ของตารางสินค้า พร้อม trigger ให้ข้อมูลตรงกันเสมอ
+    แล้ว rebuild จากข้อมูลที่มีอยู่ (เร็วกว่าให้ trigger ทำงานทีละแถวตอนโหลดข้อมูลจำนวนมาก)
+    หมายเหตุ: VACUUM อาจเปลี่ยน rowid ของตารางสินค้า ให้ rebuild ใหม่หลัง VACUUM
+    """
+    columns = ", ".join(SEARCH_COLUMNS)
+    new_values = ", ".join(f"new.{c}" for c in SEARCH_COLUMNS)
+    old_values = ", ".join(f"old.{c}" for c in SEARCH_COLUMNS)
+    cur = conn.cursor()
+    cur.execute(f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS สินค้า_fts USING fts5(
+      {columns},
+      content='สินค้า', content_rowid='rowid', tokenize='trigram'
+    );
+    """)
+    cur.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS สินค้า_fts_ai AFTER INSERT ON สินค้า BEGIN
+      INSERT INTO สินค้า_fts(rowid, {columns}) VALUES (new.rowid, {new_values});
+    END;
+    """)
+    cur.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS สินค้า_fts_ad AFTER DELETE ON สินค้า BEGIN
+      INSERT INTO สินค้า_fts(สินค้า_fts, rowid, {columns}) VALUES ('delete', old.rowid, {old_values});
+    END;
+    """)
+    cur.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS สินค้า_fts_au AFTER UPDATE OF {columns} ON สินค้า BEGIN
+      INSERT INTO สินค้า_fts(สินค้า_fts, rowid, {columns}) VALUES ('delete', old.rowid, {old_values});
+      INSERT INTO สินค้า_fts(rowid, {columns}) VALUES (new.rowid, {new_values});
+    END;
+    """)
+    cur.execute("INSERT INTO สินค้า_fts(สินค้า_fts) VALUES ('rebuild');")
+    cur.execute("INSERT INTO สินค้า_fts(สินค้า_fts) VALUES ('optimize');")
     conn.commit()
 
 def populate_categories(conn: sqlite3.Connection):
@@ -315,6 +494,207 @@ def populate_categories(conn: sqlite3.Connection):
     """, categories_data)
     conn.commit()
 
+# ตารางสรุปของสินค้า: ชื่อตาราง -> (คอลัมน์ที่ GROUP BY, [(คอลัมน์, ชนิด, นิพจน์ต่อหนึ่งแถว)])
+# {r} ในนิพจน์คือแถว new/old ใน trigger หรือ สินค้า ตอน rebuild
+SUMMARY_TABLES = {
+    "สรุป_หมวดหมู่": ("หมวดหมู่", [
+        ("จำนวนสินค้า", "INTEGER", "1"),
+        ("ผลรวมราคา", "REAL", "{r}.ราคา"),
+        ("สต็อกรวม", "INTEGER", "{r}.จำนวนสต็อก"),
+        ("มูลค่าสต็อกรวม", "REAL", "{r}.ราคา * {r}.จำนวนสต็อก"),
+        ("จำนวนต้องประกอบ", "INTEGER", "CASE WHEN {r}.ต้องประกอบ = 1 THEN 1 ELSE 0 END"),
+        ("ผลรวมราคาต้องประกอบ", "REAL", "CASE WHEN {r}.ต้องประกอบ = 1 THEN {r}.ราคา ELSE 0 END"),
+    ]),
+    "สรุป_สถานะสต็อก": ("สถานะสต็อก", [
+        ("จำนวนสินค้า", "INTEGER", "1"),
+        ("ผลรวมราคา", "REAL", "{r}.ราคา"),
+        ("สต็อกรวม", "INTEGER", "{r}.จำนวนสต็อก"),
+        ("มูลค่าสต็อกรวม", "REAL", "{r}.ราคา * {r}.จำนวนสต็อก"),
+    ]),
+}
+
+def create_summary_tables(conn: sqlite3.Connection):
+    """
+    สร้างตารางสรุปตาม SUMMARY_TABLES ให้คำถามเชิงสรุปอ่านแค่หนึ่งแถวต่อกลุ่มแทนการสแกนสินค้าทั้งตาราง
+    trigger INSERT/DELETE/UPDATE บนสินค้าจะบวก/ลบค่าของแถวนั้นเข้ากลุ่มที่เกี่ยวข้อง
+    แล้วเติมค่าเริ่มต้นด้วย GROUP BY ครั้งเดียว (แถวที่คีย์เป็น NULL จะไม่ถูกนับ)
+    """
+    cur = conn.cursor()
+    for table, (key, measures) in SUMMARY_TABLES.items():
+        names = [name for name, _, _ in measures]
+        columns = ",\n      ".join(f"{name} {col_type} NOT NULL" for name, col_type, _ in measures)
+        watched = sorted({key, *(c for c in ("ราคา", "จำนวนสต็อก", "ต้องประกอบ") if any(c in e for _, _, e in measures))})
+
+        def add(r):
+            values = ", ".join(e.format(r=r) for _, _, e in measures)
+            updates = ", ".join(f"{n} = {n} + excluded.{n}" for n in names)
+            return (f"INSERT INTO {table} ({key}, {', '.join(names)}) SELECT {r}.{key}, {values} WHERE {r}.{key} IS NOT NULL\n"
+                    f"      ON CONFLICT({key}) DO UPDATE SET {updates};")
+
+        def subtract(r):
+            updates = ", ".join(f"{n} = {n} - ({e.format(r=r)})" for n, _, e in measures)
+            return (f"UPDATE {table} SET {updates} WHERE {key} = {r}.{key};\n"
+                    f"      DELETE FROM {table} WHERE {key} = {r}.{key} AND จำนวนสินค้า = 0;")
+
+        cur.execute(f"""
+        CREATE TABLE IF NOT EXISTS {table} (
+          {key} TEXT PRIMARY KEY,
+          {columns}
+        );
+        """)
+        cur.execute(f"CREATE TRIGGER IF NOT EXISTS {table}_ai AFTER INSERT ON สินค้า BEGIN\n      {add('new')}\n    END;")
+        cur.execute(f"CREATE TRIGGER IF NOT EXISTS {table}_ad AFTER DELETE ON สินค้า BEGIN\n      {subtract('old')}\n    END;")
+        cur.execute(f"CREATE TRIGGER IF NOT EXISTS {table}_au AFTER UPDATE OF {', '.join(watched)} ON สินค้า BEGIN\n"
+                    f"      {subtract('old')}\n      {add('new')}\n    END;")
+
+        # rebuild
+        totals = ", ".join(f"SUM({e.format(r='สินค้า')})" for _, _, e in measures)
+        cur.execute(f"DELETE FROM {table};")
+        cur.execute(f"INSERT INTO {table} ({key}, {', '.join(names)}) "
+                    f"SELECT {key}, {totals} FROM สินค้า WHERE {key} IS NOT NULL GROUP BY {key};")
+    conn.commit()
+
+# ---------- ซิงก์ข้อมูลจากไฟล์ (โหมด --sync) ----------
+# ชนิดข้อมูลของแต่ละคอลัมน์ ใช้แปลงค่าจากไฟล์ให้ตรงกับที่ SQLite เก็บ เพื่อให้แฮชของสองฝั่งเทียบกันได้
+PRODUCT_COLUMN_TYPES = {
+    "รหัสสินค้า": str, "ชื่อสินค้า": str, "หมวดหมู่": str, "วัสดุ": str,
+    "ความยาว_นิ้ว": int, "ความกว้าง_นิ้ว": int, "ความสูง_นิ้ว": int, "สี": str, "ราคา": float,
+    "น้ำหนัก_ปอนด์": float, "ต้องประกอบ": bool, "การรับประกัน_ปี": int, "จำนวนสต็อก": int, "สถานะสต็อก": str,
+}
+TRUE_VALUES = {"1", "true", "t", "yes", "y", "ใช่", "จริง"}
+# แฮชเนื้อหาของสินค้าแต่ละรายการ ณ การซิงก์ครั้งล่าสุด (ตารางภายใน แอปไม่นำไปใส่ใน prompt)
+SYNC_HASH_TABLE = "แฮชสินค้า"
+
+def read_product_source(path: Path) -> Iterator[dict]:
+    """อ่านสินค้าทีละรายการจากไฟล์ CSV, JSON (array), JSON Lines หรือ Parquet"""
+    suffix = path.suffix.lower()
+    if suffix == ".csv":
+        with open(path, newline="", encoding="utf-8-sig") as f:
+            yield from csv.DictReader(f)
+    elif suffix in (".jsonl", ".ndjson"):
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+    elif suffix == ".json":
+        with open(path, encoding="utf-8") as f:
+            yield from json.load(f)
+    elif suffix == ".parquet":
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise SystemExit("การอ่านไฟล์ Parquet ต้องติดตั้ง pyarrow (pip install pyarrow)")
+        for batch in pq.ParquetFile(path).iter_batches():
+            yield from batch.to_pylist()
+    else:
+        raise SystemExit(f"ไม่รองรับไฟล์ชนิด {suffix} (ใช้ .csv, .json, .jsonl หรือ .parquet)")
+
+def _converter(kind):
+    if kind is bool:
+        return lambda v: int(v.strip().lower() in TRUE_VALUES) if isinstance(v, str) else int(bool(v))
+    if kind is int:
+        return lambda v: v if type(v) is int else int(float(v))
+    if kind is float:
+        return float
+    return lambda v: (v.strip() or None) if isinstance(v, str) else str(v)
+
+_CONVERTERS = [(column, _converter(PRODUCT_COLUMN_TYPES[column])) for column in PRODUCT_COLUMNS]
+
+def coerce_product(record: dict) -> tuple:
+    """แปลงหนึ่งรายการจากไฟล์เป็น tuple ตามลำดับ PRODUCT_COLUMNS (ค่าว่างเป็น NULL, boolean เป็น 0/1)"""
+    get = record.get
+    return tuple(None if (value := get(column)) is None or value == "" else convert(value)
+                 for column, convert in _CONVERTERS)
+
+def content_hash(*values) -> int:
+    """แฮช 64 บิตของคอลัมน์ทั้งหมดยกเว้นรหัสสินค้า (ใช้ทั้งใน Python และเป็นฟังก์ชัน SQL)"""
+    digest = hashlib.blake2b(repr(values).encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big", signed=True)
+
+def ensure_sync_state(conn: sqlite3.Connection):
+    """
+    สร้างตารางแฮช (ครั้งแรก) และเติมแฮชให้สินค้าที่ยังไม่มี
+    trigger จะลบแฮชเมื่อสินค้าถูกแก้ไขหรือลบจากช่องทางอื่น รายการนั้นจึงถูกคำนวณใหม่ในรอบถัดไป
+    """
+    conn.create_function("content_hash", len(PRODUCT_COLUMNS) - 1, content_hash, deterministic=True)
+    with conn:
+        conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {SYNC_HASH_TABLE} (
+          รหัสสินค้า TEXT PRIMARY KEY,
+          แฮช INTEGER NOT NULL
+        ) WITHOUT ROWID;
+        """)
+        conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS {SYNC_HASH_TABLE}_au AFTER UPDATE ON สินค้า BEGIN
+          DELETE FROM {SYNC_HASH_TABLE} WHERE รหัสสินค้า = old.รหัสสินค้า;
+        END;
+        """)
+        conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS {SYNC_HASH_TABLE}_ad AFTER DELETE ON สินค้า BEGIN
+          DELETE FROM {SYNC_HASH_TABLE} WHERE รหัสสินค้า = old.รหัสสินค้า;
+        END;
+        """)
+        conn.execute(f"""
+        INSERT INTO {SYNC_HASH_TABLE} (รหัสสินค้า, แฮช)
+        SELECT รหัสสินค้า, content_hash({', '.join(PRODUCT_COLUMNS[1:])}) FROM สินค้า
+        WHERE รหัสสินค้า NOT IN (SELECT รหัสสินค้า FROM {SYNC_HASH_TABLE});
+        """)
+
+def sync_products(conn: sqlite3.Connection, source: Path, batch_size: int = 10_000) -> dict:
+    """
+    ซิงก์ตารางสินค้าให้ตรงกับไฟล์ต้นทาง: เทียบทีละรายการด้วยรหัสสินค้าและแฮชเนื้อหา
+    แล้วเพิ่ม/แก้ไข/ลบเฉพาะรายการที่ต่างกันภายใน transaction เดียว (รายการที่แก้ไขจะอัปเดต อัปเดตล่าสุด)
+    รหัสสินค้าซ้ำในไฟล์จะใช้รายการแรก
+    """
+    ensure_sync_state(conn)
+    # รหัสสินค้า -> แฮชปัจจุบัน; None หมายถึงพบในไฟล์แล้ว ที่เหลือหลังอ่านไฟล์จบคือรายการที่ต้องลบ
+    current = dict(conn.execute(f"SELECT รหัสสินค้า, แฮช FROM {SYNC_HASH_TABLE};"))
+    placeholders = ", ".join("?" * len(PRODUCT_COLUMNS))
+    insert_sql = f"INSERT INTO สินค้า ({', '.join(PRODUCT_COLUMNS)}) VALUES ({placeholders})"
+    update_sql = (f"UPDATE สินค้า SET {', '.join(f'{c} = ?' for c in PRODUCT_COLUMNS[1:])}, "
+                  f"อัปเดตล่าสุด = CURRENT_TIMESTAMP WHERE รหัสสินค้า = ?")
+    hash_sql = (f"INSERT INTO {SYNC_HASH_TABLE} (รหัสสินค้า, แฮช) VALUES (?, ?) "
+                f"ON CONFLICT(รหัสสินค้า) DO UPDATE SET แฮช = excluded.แฮช")
+    counts = {"inserted": 0, "updated": 0, "deleted": 0, "unchanged": 0, "duplicates": 0}
+    inserts, updates, hashes = [], [], []
+
+    def flush():
+        # UPDATE ต้องมาก่อนบันทึกแฮช เพราะ trigger ของ UPDATE จะลบแฮชของรายการนั้น
+        conn.executemany(insert_sql, inserts)
+        conn.executemany(update_sql, updates)
+        conn.executemany(hash_sql, hashes)
+        inserts.clear(), updates.clear(), hashes.clear()
+
+    with conn:
+        for record in read_product_source(source):
+            row = coerce_product(record)
+            product_id = row[0]
+            if product_id is None:
+                raise SystemExit(f"พบรายการที่ไม่มีรหัสสินค้าใน {source}")
+            new_hash = content_hash(*row[1:])
+            if product_id not in current:
+                inserts.append(row)
+                hashes.append((product_id, new_hash))
+                counts["inserted"] += 1
+            elif current[product_id] is None:
+                counts["duplicates"] += 1
+                continue
+            elif current[product_id] != new_hash:
+                updates.append((*row[1:], product_id))
+                hashes.append((product_id, new_hash))
+                counts["updated"] += 1
+            else:
+                counts["unchanged"] += 1
+            current[product_id] = None
+            if len(inserts) + len(updates) >= batch_size:
+                flush()
+        flush()
+
+        removed = [(product_id,) for product_id, h in current.items() if h is not None]
+        conn.executemany("DELETE FROM สินค้า WHERE รหัสสินค้า = ?", removed)
+        counts["deleted"] = len(removed)
+    return counts
+
 # ---------- การวิเคราะห์ข้อมูล ----------
 def run_analysis_queries(conn: sqlite3.Connection):
     """รันคำสั่งวิเคราะห์ตัวอย่างกับข้อมูลเฟอร์นิเจอร์"""
@@ -324,14 +704,13 @@ def run_analysis_queries(conn: sqlite3.Connection):
     print("การวิเคราะห์ฐานข้อมูลเฟอร์นิเจอร์")
     print("="*60)
     
-    # จำนวนสินค้าแยกตามหมวดหมู่
+    # จำนวนสินค้าแยกตามหมวดหมู่ (อ่านจากตารางสรุป ไม่ต้องสแกนสินค้า)
     print("\n1. สินค้าแยกตามหมวดหมู่:")
     cur.execute("""
-        SELECT หมวดหมู่, COUNT(*) as จำนวนสินค้า, 
-               ROUND(AVG(ราคา), 2) as ราคาเฉลี่ย,
-               SUM(จำนวนสต็อก) as สต็อกรวม
-        FROM สินค้า 
-        GROUP BY หมวดหมู่ 
+        SELECT หมวดหมู่, จำนวนสินค้า, 
+               ROUND(ผลรวมราคา / จำนวนสินค้า, 2) as ราคาเฉลี่ย,
+               สต็อกรวม
+        FROM สรุป_หมวดหมู่ 
         ORDER BY จำนวนสินค้า DESC
     """)
     for row in cur.fetchall():
@@ -339,14 +718,15 @@ def run_analysis_queries(conn: sqlite3.Connection):
     
     # การวิเคราะห์ราคา
     print("\n2. การวิเคราะห์ราคา:")
+    # MIN/MAX ใช้ idx_สินค้า_ราคา ส่วนยอดรวมมาจากตารางสรุป
     cur.execute("""
         SELECT 
-            COUNT(*) as จำนวนสินค้าทั้งหมด,
-            ROUND(MIN(ราคา), 2) as ราคาต่ำสุด,
-            ROUND(MAX(ราคา), 2) as ราคาสูงสุด,
-            ROUND(AVG(ราคา), 2) as ราคาเฉลี่ย,
-            ROUND(SUM(ราคา * จำนวนสต็อก), 2) as มูลค่าสต็อกรวม
-        FROM สินค้า
+            SUM(จำนวนสินค้า) as จำนวนสินค้าทั้งหมด,
+            (SELECT ROUND(MIN(ราคา), 2) FROM สินค้า) as ราคาต่ำสุด,
+            (SELECT ROUND(MAX(ราคา), 2) FROM สินค้า) as ราคาสูงสุด,
+            ROUND(SUM(ผลรวมราคา) / SUM(จำนวนสินค้า), 2) as ราคาเฉลี่ย,
+            ROUND(SUM(มูลค่าสต็อกรวม), 2) as มูลค่าสต็อกรวม
+        FROM สรุป_หมวดหมู่
     """)
     result = cur.fetchone()
     print(f"   จำนวนสินค้าทั้งหมด: {result[0]}")
@@ -357,12 +737,16 @@ def run_analysis_queries(conn: sqlite3.Connection):
     # การวิเคราะห์การประกอบและการรับประกัน
     print("\n3. การวิเคราะห์การประกอบและการรับประกัน:")
     cur.execute("""
-        SELECT 
-            CASE WHEN ต้องประกอบ = 1 THEN 'ต้องประกอบ' ELSE 'ไม่ต้องประกอบ' END as การประกอบ,
-            COUNT(*) as จำนวน,
-            ROUND(AVG(ราคา), 2) as ราคาเฉลี่ย
-        FROM สินค้า 
-        GROUP BY ต้องประกอบ
+        SELECT * FROM (
+            SELECT 'ไม่ต้องประกอบ' as การประกอบ,
+                   SUM(จำนวนสินค้า - จำนวนต้องประกอบ) as จำนวน,
+                   ROUND(SUM(ผลรวมราคา - ผลรวมราคาต้องประกอบ) / SUM(จำนวนสินค้า - จำนวนต้องประกอบ), 2) as ราคาเฉลี่ย
+            FROM สรุป_หมวดหมู่
+            UNION ALL
+            SELECT 'ต้องประกอบ', SUM(จำนวนต้องประกอบ),
+                   ROUND(SUM(ผลรวมราคาต้องประกอบ) / SUM(จำนวนต้องประกอบ), 2)
+            FROM สรุป_หมวดหมู่
+        ) WHERE จำนวน > 0
     """)
     for row in cur.fetchall():
         print(f"   {row[0]}: {row[1]} ชิ้น, ราคาเฉลี่ย: ${row[2]:,}")
@@ -380,9 +764,9 @@ def run_analysis_queries(conn: sqlite3.Connection):
     # สถานะสต็อก
     print("\n4. สถานะสต็อก:")
     cur.execute("""
-        SELECT สถานะสต็อก, COUNT(*) as จำนวน, SUM(จำนวนสต็อก) as ชิ้นรวม
-        FROM สินค้า 
-        GROUP BY สถานะสต็อก
+        SELECT สถานะสต็อก, จำนวนสินค้า as จำนวน, สต็อกรวม as ชิ้นรวม
+        FROM สรุป_สถานะสต็อก
+        ORDER BY สถานะสต็อก
     """)
     for row in cur.fetchall():
         print(f"   {row[0]}: {row[1]} รายการ, {row[2]} ชิ้น")
@@ -405,12 +789,69 @@ def run_analysis_queries(conn: sqlite3.Connection):
         FROM สินค้า 
         WHERE จำนวนสต็อก < 5
         ORDER BY จำนวนสต็อก ASC
+        LIMIT 20
     """)
     for row in cur.fetchall():
         print(f"   {row[2]} ชิ้น - {row[0]} ({row[1]}) - ${row[3]:,}")
 
+    # ค้นหาด้วยข้อความบางส่วนผ่าน FTS5 (แทน วัสดุ LIKE '%หนัง%')
+    print("\n7. สินค้าที่วัสดุมีคำว่า 'หนัง' (ค้นผ่าน สินค้า_fts):")
+    cur.execute("""
+        SELECT COUNT(*) FROM สินค้า
+        WHERE rowid IN (SELECT rowid FROM สินค้า_fts WHERE สินค้า_fts MATCH 'วัสดุ:"หนัง"')
+    """)
+    print(f"   {cur.fetchone()[0]} รายการ")
+
 # ---------- ฟังก์ชันหลัก ----------
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="สร้างฐานข้อมูลเฟอร์นิเจอร์ (ข้อมูลตัวอย่าง หรือข้อมูลสังเคราะห์ด้วย --rows) หรือซิงก์จากไฟล์ด้วย --sync")
+    parser.add_argument("--rows", type=int, default=0, help="จำนวนสินค้าสังเคราะห์ (0 = ใช้ข้อมูลตัวอย่าง 15 รายการ)")
+    parser.add_argument("--seed", type=int, default=42, help="seed ของตัวสุ่ม ได้ข้อมูลเดิมทุกครั้งเมื่อใช้ seed เดิม")
+    parser.add_argument("--chunk-size", type=int, default=200_000, help="จำนวนแถวต่อ transaction")
+    parser.add_argument("--db", type=Path, default=DB_PATH, help="ไฟล์ฐานข้อมูลปลายทาง")
+    parser.add_argument("--skip-analysis", action="store_true", help="ไม่รันคำสั่งวิเคราะห์หลังสร้างเสร็จ")
+    parser.add_argument("--sync", type=Path, metavar="FILE",
+                        help="ซิงก์ฐานข้อมูลเดิมกับไฟล์สินค้า (.csv/.json/.jsonl/.parquet) แทนการสร้างใหม่")
+    return parser.parse_args()
+
+def main_sync(args):
+    if not args.db.exists():
+        raise SystemExit(f"ไม่พบฐานข้อมูล {args.db} (สร้างก่อนด้วย build_furniture_db.py)")
+    print(f"กำลังซิงก์ {args.db} กับ {args.sync}...")
+    started = time.perf_counter()
+    conn = sqlite3.connect(args.db)
+    try:
+        counts = sync_products(conn, args.sync)
+        conn.execute("PRAGMA optimize;")
+    finally:
+        conn.close()
+    print(f"ซิงก์เสร็จใน {time.perf_counter() - started:.1f} วินาที: เพิ่ม {counts['inserted']:,}, "
+          f"แก้ไข {counts['updated']:,}, ลบ {counts['deleted']:,}, ไม่เปลี่ยน {counts['unchanged']:,} รายการ")
+    if counts["duplicates"]:
+        print(f"ข้ามรหัสสินค้าซ้ำในไฟล์ {counts['duplicates']:,} รายการ (ใช้รายการแรก)")
+
+def main_generated(args):
+    print(f"กำลังสร้างฐานข้อมูลสังเคราะห์ {args.rows:,} รายการ (seed={args.seed})...")
+    started = time.perf_counter()
+    build_generated_db(args.db, args.rows, args.seed, args.chunk_size)
+    print(f"\nสร้างฐานข้อมูลสำเร็จใน {time.perf_counter() - started:.1f} วินาที: {args.db.resolve()}")
+    print(f"ขนาดฐานข้อมูล: {args.db.stat().st_size / 1024 / 1024:.1f} MB")
+    if not args.skip_analysis:
+        conn = sqlite3.connect(args.db)
+        run_analysis_queries(conn)
+        conn.close()
+
 def main():
+    args = parse_args()
+    if args.sync:
+        main_sync(args)
+        return
+    if args.rows > 0:
+        main_generated(args)
+        return
+    db_path = args.db
+
     print("กำลังสร้างฐานข้อมูลเฟอร์นิเจอร์...")
     
     # สร้างข้อมูลเฟอร์นิเจอร์
@@ -418,10 +859,10 @@ def main():
     print(f"สร้างข้อมูลเฟอร์นิเจอร์ {len(furniture_df)} รายการ")
     
     # สร้างฐานข้อมูลใหม่
-    if DB_PATH.exists():
-        DB_PATH.unlink()
+    if db_path.exists():
+        db_path.unlink()
     
-    conn = sqlite3.connect(DB_PATH)
+    conn = sqlite3.connect(db_path)
     
     # สร้างโครงสร้าง
     create_schema(conn)
@@ -439,8 +880,8 @@ def main():
     run_analysis_queries(conn)
     
     conn.close()
-    print(f"\nสร้างฐานข้อมูลสำเร็จ: {DB_PATH.resolve()}")
-    print(f"ขนาดฐานข้อมูล: {DB_PATH.stat().st_size / 1024:.1f} KB")
+    print(f"\nสร้างฐานข้อมูลสำเร็จ: {db_path.resolve()}")
+    print(f"ขนาดฐานข้อมูล: {db_path.stat().st_size / 1024:.1f} KB")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
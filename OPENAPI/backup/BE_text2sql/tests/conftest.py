@@ -0,0 +1,46 @@
+"""
+Import app against a freshly built sample furniture.db without watsonx credentials.
+
+The model client is replaced before app is imported: these tests cover the
+code paths that answer questions without calling the model.
+"""
+import os
+import sqlite3
+import sys
+import tempfile
+from pathlib import Path
+
+import ibm_watsonx_ai.foundation_models
+
+HERE = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(HERE))
+
+import build_furniture_db  # noqa: E402
+
+
+class OfflineModelInference:
+    """Fails loudly if a test reaches the model."""
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def __getattr__(self, name):
+        raise AssertionError(f"test called the model ({name})")
+
+
+def _build_sample_db(path: Path) -> None:
+    conn = sqlite3.connect(path)
+    build_furniture_db.create_schema(conn)
+    build_furniture_db.populate_categories(conn)
+    build_furniture_db.create_furniture_data().to_sql("สินค้า", conn, if_exists="append", index=False)
+    conn.close()
+
+
+_db_dir = tempfile.mkdtemp(prefix="text2sql-tests-")
+_db_path = Path(_db_dir) / "furniture.db"
+_build_sample_db(_db_path)
+
+os.environ["FURNITURE_DB_PATH"] = str(_db_path)
+os.environ.setdefault("WATSONX_API_KEY", "test")
+os.environ.setdefault("WATSONX_PROJECT_ID", "test")
+ibm_watsonx_ai.foundation_models.ModelInference = OfflineModelInference
@@ -0,0 +1,25 @@
+import asyncio
+
+import app
+
+
+def test_queries_run_while_streams_hold_every_connection(monkeypatch):
+    monkeypatch.setattr(app.db_pool, "timeout", 2.0)
+
+    async def scenario():
+        streams = [app.aiter_select("SELECT ชื่อสินค้า FROM สินค้า", 1) for _ in range(app.DB_POOL_SIZE)]
+        for stream in streams:
+            await anext(stream)  # column names sent: the stream now holds a connection
+        queries = [
+            asyncio.create_task(app.run_with_connection(app.run_select, "SELECT 1 AS x", None))
+            for _ in range(2 * app.DB_EXECUTOR_WORKERS)
+        ]
+        await asyncio.sleep(0.1)
+        for stream in streams:
+            async for _ in stream:
+                pass
+        return await asyncio.wait_for(asyncio.gather(*queries), 1.0)
+
+    results = asyncio.run(scenario())
+    assert [r["row_count"] for r in results] == [1] * (2 * app.DB_EXECUTOR_WORKERS)
+    assert app.db_pool.stats()["timeouts"] == 0
@@ -0,0 +1,114 @@
+import pytest
+
+import app
+
+
+def slots_of(question):
+    return app.extract_slots(app.normalize_question(question))[0]
+
+
+# ---------- questions a template answers exactly ----------
+@pytest.mark.parametrize("question, template", [
+    ("สินค้าในแต่ละหมวดหมู่มีกี่ชิ้น", "category_summary"),
+    ("ราคาเฉลี่ยของสินค้าในแต่ละหมวดหมู่", "category_summary"),
+    ("สินค้าที่ต้องประกอบและไม่ต้องประกอบมีกี่ชิ้น", "assembly_summary"),
+    ("มูลค่าสต็อกรวมของสินค้าทั้งหมด", "inventory_value"),
+    ("สินค้าในหมวดห้องนั่งเล่นทั้งหมด", "product_search"),
+    ("สินค้าที่มีสถานะสต็อกน้อยคืออะไร", "product_search"),
+    ("สินค้าที่ราคาสูงกว่า 1000 บาทมีอะไรบ้าง", "product_search"),
+    ("list oak products", "product_search"),
+])
+def test_routes_supported_questions(question, template):
+    routed = app.route_intent(question)
+    assert routed is not None
+    assert routed[0] == template
+
+
+def test_price_slot_keeps_comparison_direction():
+    assert "ราคา > 1000" in app.route_intent("สินค้าราคา > 1000 บาทมีอะไรบ้าง")[1]
+    assert "ราคา < 1000" in app.route_intent("สินค้าราคา < 1000 บาทมีอะไรบ้าง")[1]
+    assert "ราคา < 500" in app.route_intent("สินค้าราคาไม่เกิน 500 บาทมีอะไรบ้าง")[1]
+
+
+def test_category_filter_sql():
+    _, sql = app.route_intent("สินค้าในหมวดห้องนั่งเล่นทั้งหมด")
+    assert "หมวดหมู่ = 'ห้องนั่งเล่น'" in sql
+
+
+# ---------- questions a template would answer wrongly ----------
+@pytest.mark.parametrize("question", [
+    # negation: the slot filter would select exactly the excluded rows
+    "สินค้าที่ไม่ได้ทำจากไม้มีอะไรบ้าง",
+    "สินค้าที่ไม่ใช่หมวดห้องนอนทั้งหมด",
+    "มูลค่าสต็อกของสินค้าที่ไม่ใช่ห้องนอน",
+    "สินค้าทั้งหมด ยกเว้นห้องนอน",
+    "สินค้าที่ไม่ต้องประกอบมีอะไรบ้าง",
+    "ราคาไม่มากกว่า 500 บาทมีอะไรบ้าง",
+    "list products that are not oak",
+    "list products that aren't oak",
+    "list products except bedroom",
+    "list products without leather",
+    # ranking: no template computes max/min/top-N
+    "ราคาสูงสุดของสินค้าในแต่ละหมวด",
+    "สินค้าที่ราคาต่ำสุดในแต่ละหมวดหมู่",
+    "สินค้าที่แพงที่สุดในหมวดห้องนอนมีอะไรบ้าง",
+    "สินค้าที่ถูกที่สุดในแต่ละหมวด",
+    "show the cheapest oak products",
+    "top 5 products per category",
+    "max price per category",
+    "list office products sorted by price",
+    # several values for one slot: a single equality filter keeps only one of them
+    "สินค้าห้องนอนหรือห้องนั่งเล่นทั้งหมด",
+    "show leather and fabric products",
+    "สินค้าไม้โอ๊คหรือสักมีอะไรบ้าง",
+    # a comparison no slot consumed
+    "สินค้าที่สต็อกน้อยกว่าสิบชิ้นมีอะไรบ้าง",
+    # an aggregate the template does not compute
+    "มูลค่าสต็อกสินค้าเฉลี่ย",
+    "สินค้าห้องนอนมีกี่รายการ",
+])
+def test_rejects_negated_or_ranked_questions(question):
+    assert app.route_intent(question) is None
+
+
+# ---------- slot extraction ----------
+def test_extract_price_between():
+    assert slots_of("สินค้าราคาระหว่าง 100 ถึง 1,000 บาท")["price"] == ("between", [100.0, 1000.0])
+
+
+def test_extract_price_keeps_decimals():
+    assert slots_of("สินค้าราคาต่ำกว่า 99.50 บาท")["price"] == ("<", [99.5])
+
+
+def test_extract_not_over_is_upper_bound():
+    assert slots_of("สินค้าราคาไม่เกิน 500 บาท")["price"] == ("<", [500.0])
+
+
+def test_extract_price_from_operator_symbols():
+    assert slots_of("ราคา > 500")["price"] == (">", [500.0])
+    assert slots_of("ราคา < 500")["price"] == ("<", [500.0])
+    assert "price" not in slots_of("ราคา >= 500")
+
+
+def test_extract_category_material_stock_status():
+    slots = slots_of("สินค้าไม้โอ๊คในห้องนอนที่สต็อกน้อย")
+    assert slots == {"category": "ห้องนอน", "material": "ไม้โอ๊ค", "stock_status": "สต็อกน้อย"}
+
+
+def test_extract_prefers_longest_material():
+    assert slots_of("สินค้าหนังเทียม")["material"] == "หนังเทียม"
+
+
+def test_extract_marks_multi_valued_slot_ambiguous():
+    slots = slots_of("สินค้าห้องนอนหรือห้องนั่งเล่นทั้งหมด")
+    assert slots["ambiguous"] == ["category"]
+    assert "category" not in slots
+
+
+def test_extract_low_stock_comparison_is_not_a_status():
+    assert "stock_status" not in slots_of("สินค้าที่สต็อกน้อยกว่าสิบชิ้น")
+
+
+def test_extract_leaves_unexplained_numbers():
+    _, rest = app.extract_slots(app.normalize_question("สินค้าที่น้ำหนักมากกว่า 100 ปอนด์"))
+    assert "100" in rest
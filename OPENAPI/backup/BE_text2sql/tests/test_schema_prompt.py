@@ -0,0 +1,21 @@
+from fastapi.testclient import TestClient
+
+import app
+
+
+def test_schema_is_introspected_at_startup(monkeypatch):
+    monkeypatch.setattr(app, "_schema", None)
+    with TestClient(app.app):
+        assert app._schema is not None
+
+
+def test_material_hint_uses_curated_list():
+    prompt = app.build_sql_prompt("สินค้าที่ทำจากไม้มีอะไรบ้าง")
+    assert "- Common materials: 'ไม้โอ๊ค', 'หนังแท้'" in prompt
+    assert "กลไกเหล็ก" not in prompt  # raw composite values are not offered as materials
+
+
+def test_value_hints_follow_pruning():
+    prompt = app.build_sql_prompt("ราคาเฉลี่ยของสินค้าแต่ละหมวดหมู่")
+    assert "- Common categories: " in prompt and "'ห้องนั่งเล่น'" in prompt
+    assert "Common materials" not in prompt
@@ -0,0 +1,29 @@
+import pytest
+
+import app
+
+
+@pytest.fixture
+def cache():
+    return app.SQLGenerationCache(max_entries=16, ttl_seconds=3600, similarity=0.85)
+
+
+def test_near_duplicate_reuses_sql(cache):
+    cache.put("สินค้าในหมวดห้องนอนที่ต้องประกอบมีอะไรบ้าง", None, "SQL")
+    assert cache.get("สินค้าในหมวด ห้องนอน ที่ต้องประกอบ มีอะไรบ้างคะ", None) == "SQL"
+    assert cache.stats()["similar_hits"] == 1
+
+
+@pytest.mark.parametrize("cached, question", [
+    ("สินค้าในหมวดห้องนอนที่ต้องประกอบและมีสถานะสต็อกน้อยมีอะไรบ้าง",
+     "สินค้าในหมวดห้องนอนที่ไม่ต้องประกอบและมีสถานะสต็อกน้อยมีอะไรบ้าง"),
+    ("list bedroom products that requires assembly", "list bedroom products that requires no assembly"),
+    ("สินค้าในหมวดห้องนอนที่มีสถานะสต็อกน้อยและราคามากกว่า 500 บาทมีอะไรบ้าง",
+     "สินค้าในหมวดห้องนอนที่มีสถานะสต็อกน้อยและราคาต่ำกว่า 500 บาทมีอะไรบ้าง"),
+    ("สินค้าในหมวดห้องนอนที่มีสถานะสต็อกน้อยและราคามากกว่า 500 บาทมีอะไรบ้าง",
+     "สินค้าในหมวดห้องนอนที่มีสถานะสต็อกน้อยและราคามากกว่า 600 บาทมีอะไรบ้าง"),
+    ("สินค้าที่ราคาสูงในหมวดห้องนอนทั้งหมดมีอะไรบ้าง", "สินค้าที่ราคาสูงสุดในหมวดห้องนอนทั้งหมดมีอะไรบ้าง"),
+])
+def test_near_duplicate_must_share_qualifiers(cache, cached, question):
+    cache.put(cached, None, "SQL")
+    assert cache.get(question, None) is None